@@ -1,6 +1,11 @@
+import json
+import os
+import urllib.parse
+import uuid
+
+import httpx
 import streamlit as st
 
-from src.Agent import productSearch
 
 def get_search_products(query):
     sample_product = {
@@ -17,76 +22,180 @@ def get_search_products(query):
     products = [dict(sample_product, product_id=str(i), name=f"Product {i}") for i in range(1, 16)]
     return products
 
-def get_price_comparison(results):
-    return [
-        [
-            results[platform].get("min_price", None),
-            results[platform].get("max_price", None),
-            platform,
-            results[platform].get("product", [{}])[0].get("name", "Unknown Product")
-        ]
-        for platform in results.keys()
-    ]
-
 @st.cache_resource
-def get_database_session():
-    return productSearch()
+def get_api_client():
+    # The search engine runs in the API service (server.py); the UI only renders its events.
+    return httpx.Client(base_url=os.getenv("SEARCH_API_URL", "http://localhost:8000"),
+                        timeout=httpx.Timeout(60.0, connect=5.0))
+
+def stream_search(client, query, session_id):
+    with client.stream("POST", "/search/stream", json={"query": query, "session_id": session_id}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                yield json.loads(line)
+
+# Thumbnail endpoint as the browser reaches it, which may differ from SEARCH_API_URL (the
+# address this server uses). Unset embeds the platforms' images directly.
+thumbnail_url = os.getenv("THUMBNAIL_URL", "")
+
+def image_src(img_url, width=150):
+    if not thumbnail_url or not img_url:
+        return img_url
+    return f"{thumbnail_url}?{urllib.parse.urlencode({'url': img_url, 'w': width})}"
+
+def render_products(slot, products):
+    cards = []
+    for product in products:
+        card = f"""
+        <a href="{product['product_url']}" target="_blank" style="text-decoration: none; color: inherit;">
+            <div style="border: 1px solid #ddd; padding: 10px; margin: 10px 0; display: flex; align-items: center;">
+                <img src="{image_src(product['img_url'])}" width="150" loading="lazy" decoding="async" style="margin-right: 20px;">
+                <div>
+                    <h4>{product['name']}</h4>
+                    <p><strong>Price:</strong> ${product['price']}</p>
+                    <p><strong>Platform:</strong> {product['platform']}</p>
+                </div>
+            </div>
+        </a>
+        """
+        # Strip indentation so markdown does not turn the HTML into code blocks.
+        cards.append("".join(line.strip() for line in card.splitlines()))
+    # One markdown call for the whole list instead of one per product.
+    slot.markdown("\n".join(cards), unsafe_allow_html=True)
+
+# Products per results page; every page is rendered in one markdown call.
+page_size = int(os.getenv("RESULTS_PAGE_SIZE", 10))
+
+# Sort orders for the results view; missing values go last.
+sort_orders = {
+    "Price: low to high": lambda p: (p.get('price') is None, p.get('price') or 0),
+    "Price: high to low": lambda p: (p.get('price') is None, -(p.get('price') or 0)),
+    "Rating": lambda p: (p.get('ratings') is None, -(p.get('ratings') or 0)),
+    "Delivery date": lambda p: (p.get('delivery_date') is None, p.get('delivery_date') or ""),
+}
+
+def reset_page():
+    st.session_state.page = 1
+
+def run_search(client, query, session_id):
+    """
+    Stream one search, showing platforms as they arrive and the summary as it streams.
+    Returns the finished search, which is kept in the session and rendered from there,
+    or None if the search failed.
+    """
+    search = {"query": query, "tools": {}, "results": {}, "observation": "", "comparison": [],
+              "partial": False, "stale": False, "orders": {}}
+    live = st.empty()
+    with live.container():
+        summary_slot = st.empty()
+        results_slot = st.empty()
+        for event in stream_search(client, query, session_id):
+            if event["type"] == "plan":
+                search["tools"] = event["tools"]
+            elif event["type"] == "platform":
+                search["results"][event["platform"]] = event["result"]
+                if search["tools"].get('search_products'):
+                    render_products(results_slot, event["aggregated"][:page_size])
+            elif event["type"] == "step":
+                # The text so far was the agent's thought before searching again.
+                search["observation"] = ""
+            elif event["type"] == "summary":
+                search["observation"] += event["token"]
+                if search["tools"].get('search_products'):
+                    summary_slot.write(search["observation"])
+            elif event["type"] == "done":
+                search["results"] = event["products"]
+                search["comparison"] = event["comparison"]
+                search["partial"] = event["partial"]
+                search["stale"] = event["stale"]
+            elif event["type"] == "error":
+                st.error(event["error"])
+                return None
+    # The live view is replaced by the paginated one.
+    live.empty()
+    return search
+
+def render_page(search, products):
+    """
+    One page of the products in the selected order. Orders are computed once per search.
+    """
+    sort_column, page_column = st.columns([3, 1])
+    sort = sort_column.selectbox("Sort by", list(sort_orders), key="sort", on_change=reset_page)
+    if sort not in search["orders"]:
+        search["orders"][sort] = sorted(products, key=sort_orders[sort])
+    ordered = search["orders"][sort]
+
+    pages = max(1, -(-len(ordered) // page_size))
+    st.session_state.page = min(st.session_state.get("page", 1), pages)
+    page = page_column.number_input(f"Page (of {pages})", min_value=1, max_value=pages, key="page")
+    start = (page - 1) * page_size
+    render_products(st.container(), ordered[start:start + page_size])
+    st.caption(f"{start + 1}-{min(start + page_size, len(ordered))} of {len(ordered)} products")
+
+def render_comparison(comparison):
+    # Matched pairs of the same product, largest saving first, in one markdown call.
+    rows = []
+    for pair in comparison[:10]:
+        rows.append(
+            f'<div style="text-align: center; font-size: 20px; margin: 20px 0;">'
+            f'<b>{pair["name"]}</b> costs <a href="{pair["amazon_url"]}" target="_blank"><b>${pair["amazon_price"]}</b> on Amazon</a> '
+            f'and <a href="{pair["walmart_url"]}" target="_blank"><b>${pair["walmart_price"]}</b> on Walmart</a>: '
+            f'save <b>${pair["saving"]}</b> on <b>{pair["cheaper"].title()}</b></div>'
+        )
+    st.markdown("\n".join(rows), unsafe_allow_html=True)
+
+def render_search(search):
+    tools, results = search["tools"], search["results"]
+    if search["partial"]:
+        st.warning("Some platforms were too slow to answer; results may be incomplete.")
+    if search.get("stale"):
+        ages = [result["age_s"] for result in results.values() if result.get("stale")]
+        st.info(f"Some results are from the local catalog, up to {max(ages) // 60} minutes old; prices may have changed.")
+
+    if tools.get('search_products'):
+        st.subheader("Search Results")
+        products = [product for result in results.values() for product in result.get('products', [])]
+        if not products:
+            st.info("Not found anything")
+        else:
+            st.write(search["observation"])
+            render_page(search, products)
+
+        if tools.get('check_discount') and results:
+            first_platform = list(results.keys())[0]
+            if results[first_platform].get('discount_validity'):
+                st.sidebar.info("Coupon applicable on these products!")
+            else:
+                st.sidebar.info("Coupon is not applicable on these products!")
+
+    if tools.get('price_comparison'):
+        st.subheader("Price Comparison")
+        if not search["comparison"]:
+            st.info("No product was found on both platforms yet.")
+        render_comparison(search["comparison"])
 
 def main():
     st.set_page_config(page_title="Sh🍓ppin' app", layout="wide")
     st.title("Sh🍓ppin Search")
     query = st.text_input("Enter your search query", value="")
-    engine = get_database_session()
-    
-    if query:
-        results, tools, observation = engine.search(query)
-        if tools['search_products']:
-            aggregated_products = []
-            for platform in results.keys():
-                platform_products = results[platform]['products'][:25]
-                aggregated_products.extend(platform_products)
-            aggregated_products = sorted(aggregated_products, key=lambda x: x['price'])
-            
-            if not aggregated_products:
-                st.info("Not found anything")
-            else:
-                st.subheader("Search Results")
-                st.write(observation)
-                for product in aggregated_products:
-                    html = f"""
-                    <a href="{product['product_url']}" target="_blank" style="text-decoration: none; color: inherit;">
-                        <div style="border: 1px solid #ddd; padding: 10px; margin: 10px 0; display: flex; align-items: center;">
-                            <img src="{product['img_url']}" width="150" style="margin-right: 20px;">
-                            <div>
-                                <h4>{product['name']}</h4>
-                                <p><strong>Price:</strong> ${product['price']}</p>
-                                <p><strong>Platform:</strong> {product['platform']}</p>
-                            </div>
-                        </div>
-                    </a>
-                    """
-                    st.markdown(html, unsafe_allow_html=True)
-            
-            first_platform = list(results.keys())[0]
-            if tools['check_discount']:
-                if results[first_platform]['discount_validity']:
-                    st.sidebar.info("Coupon applicable on these products!")
-                else:
-                    st.sidebar.info("Coupon is not applicable on these products!")
-        
-        if tools['price_comparison']:
-            st.subheader("Price Comparison")
-            comparison_list = get_price_comparison(results)
-            for comp in comparison_list:
-                min_price, max_price, platform, prod_name = comp
-                st.markdown(
-                    f"""
-                    <div style="text-align: center; font-size: 20px; margin: 20px 0;">
-                        Product price starts from <b>${min_price}</b> up to <b>${max_price}</b> on <b>{platform}</b> for <b>{prod_name}</b>
-                    </div>
-                    """,
-                    unsafe_allow_html=True,
-                )
+    client = get_api_client()
+    # Each browser session keeps its own bounded conversation with the agent.
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+
+    if not query:
+        return
+    # Streamlit reruns the script on every interaction; paging and sorting reuse the
+    # session's last search and only a new query goes to the agent.
+    search = st.session_state.get("search")
+    if search is None or search["query"] != query:
+        search = run_search(client, query, st.session_state.session_id)
+        if search is None:
+            return
+        st.session_state.search = search
+        reset_page()
+    render_search(search)
 
 if __name__ == "__main__":
     main()
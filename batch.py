@@ -0,0 +1,155 @@
+"""
+Offline batch search driven by a JSONL file.
+
+    python batch.py queries.jsonl results.jsonl --concurrency 16
+
+Each input line is {"query": ..., "id": ...}; the id defaults to the line number.
+Results are appended to the output as they finish, one JSON object per line. Records
+already answered in the output are skipped, so an interrupted sweep resumes where it
+stopped and only failed queries are retried.
+"""
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("batch")
+
+from src.Agent import productSearch  # noqa: E402
+from src.Cache import normalize_query  # noqa: E402
+from src.RateLimit import priority  # noqa: E402
+
+
+def read_queries(path):
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            record.setdefault("id", number)
+            yield record
+
+
+def completed_ids(path):
+    """
+    Ids with a successful result in an existing output file.
+    """
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run.
+                continue
+            if "error" not in record:
+                done.add(str(record["id"]))
+    return done
+
+
+def search_one(engine, query, session_id):
+    start = time.perf_counter()
+    try:
+        # Sweeps yield platform rate and quota to interactive searches.
+        with priority("batch"):
+            event = engine.search_event(query, session_id)
+    finally:
+        # Batch queries are independent; do not keep thousands of conversations around.
+        engine.close_session(session_id)
+    return {**{key: event[key] for key in ("tools", "products", "comparison", "observation", "partial", "stale")},
+            "elapsed_s": round(time.perf_counter() - start, 3)}
+
+
+# BATCH RUNNER
+class BatchRunner:
+    def __init__(self, engine, concurrency: int = 8, progress_every: int = 50):
+        """
+        Run searches with at most `concurrency` in flight. Queries that normalize to the
+        same text as a search in flight share it; later repeats, like platform calls, are
+        answered from the engine's plan and search caches. Only in-flight searches are held,
+        and each result is dropped once written, so memory does not grow with the input.
+        """
+        self.engine = engine
+        self.concurrency = concurrency
+        self.progress_every = progress_every
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.counts = {"written": 0, "errors": 0, "deduplicated": 0, "skipped": 0}
+
+    def run(self, input_path, output_path):
+        done = completed_ids(output_path)
+        # Normalized query -> future of the search in flight.
+        shared = {}
+        start = time.perf_counter()
+        with open(output_path, "a") as out:
+            for record in read_queries(input_path):
+                if str(record["id"]) in done:
+                    self.counts["skipped"] += 1
+                    continue
+                key = normalize_query(record["query"])
+                with self.lock:
+                    future = shared.get(key)
+                if future is None:
+                    # Blocks while `concurrency` searches are running, so input is read lazily.
+                    self.slots.acquire()
+                    future = self.executor.submit(search_one, self.engine, record["query"], f"batch-{record['id']}")
+                    with self.lock:
+                        shared[key] = future
+                    future.add_done_callback(lambda f, key=key: self.finish(shared, key, f))
+                else:
+                    self.counts["deduplicated"] += 1
+                future.add_done_callback(lambda f, record=record: self.write(out, record, f, start))
+            self.executor.shutdown(wait=True)
+
+        report = self.report(start)
+        logger.info("batch finished: %s", json.dumps(report))
+        return report
+
+    def finish(self, shared, key, future):
+        with self.lock:
+            if shared.get(key) is future:
+                del shared[key]
+        self.slots.release()
+
+    def write(self, out, record, future, start):
+        error = future.exception()
+        result = {"error": repr(error)} if error is not None else future.result()
+        line = json.dumps({"id": record["id"], "query": record["query"], **result}, default=str)
+        with self.lock:
+            out.write(line + "\n")
+            out.flush()
+            self.counts["written"] += 1
+            self.counts["errors"] += error is not None
+            if self.counts["written"] % self.progress_every == 0:
+                logger.info("%d written, %.2f queries/s", self.counts["written"],
+                            self.counts["written"] / (time.perf_counter() - start))
+
+    def report(self, start):
+        elapsed = time.perf_counter() - start
+        return {**self.counts, "elapsed_s": round(elapsed, 3),
+                "throughput_qps": round(self.counts["written"] / elapsed, 3) if elapsed else 0.0,
+                "stats": self.engine.stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run product searches from a JSONL file.")
+    parser.add_argument("input", nargs="?", default="queries.jsonl", help="JSONL file with one {\"query\": ...} per line")
+    parser.add_argument("output", nargs="?", default="results.jsonl", help="JSONL results, appended and resumable")
+    parser.add_argument("--concurrency", type=int, default=8, help="searches in flight")
+    parser.add_argument("--progress-every", type=int, default=50)
+    args = parser.parse_args()
+
+    runner = BatchRunner(productSearch(), args.concurrency, args.progress_every)
+    print(json.dumps(runner.run(args.input, args.output), indent=2))
+
+
+if __name__ == "__main__":
+    main()
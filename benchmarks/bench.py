@@ -0,0 +1,152 @@
+"""
+End-to-end latency benchmark against the offline stand-ins.
+
+    python -m benchmarks.bench --users 8 --requests 5 --latency 0.3 --llm-latency 0.6
+    python -m benchmarks.bench --json bench.json --max-p95 total=2.5
+
+Reports p50/p95/p99 per stage (plan, first platform, all platforms, summary, total)
+and throughput at N concurrent users. With --max-p95 the exit code is non-zero when
+a stage's p95 exceeds its limit, so the run can gate a deploy.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.stubs import start_stubs
+
+
+stages = ("plan", "first_platform", "all_platforms", "summary", "total")
+
+queries = [
+    "white sneakers size 8 under $70",
+    "nike running shoe",
+    "black sports t-shirt size M",
+    "bluetooth headphones under $120",
+    "stainless steel water bottle",
+    "usb c charger under $30",
+]
+
+
+def timed_search(engine, question, session_id):
+    """
+    Run one streaming search and return the time at which each stage finished.
+    """
+    start = time.perf_counter()
+    marks = {}
+    for event in engine.stream(question, session_id):
+        now = time.perf_counter() - start
+        if event["type"] == "plan":
+            marks["plan"] = now
+        elif event["type"] == "platform":
+            marks.setdefault("first_platform", now)
+            marks["all_platforms"] = now
+        elif event["type"] == "done":
+            marks["total"] = now
+    marks.setdefault("first_platform", marks.get("plan", 0.0))
+    marks.setdefault("all_platforms", marks["first_platform"])
+    marks["summary"] = marks["total"] - marks["all_platforms"]
+    return marks
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return {f"p{p}": round(float(np.percentile(values, p)), 4) for p in (50, 95, 99)}
+
+
+def run_user(engine, user, requests, unique):
+    """
+    One simulated user: searches run one after another in the user's own session.
+    """
+    results = []
+    for r in range(requests):
+        question = f"{queries[(user + r) % len(queries)]}{f' #{user}-{r}' if unique else ''}"
+        try:
+            results.append(timed_search(engine, question, f"bench-{user}"))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+def run(users, requests, unique):
+    from src.Agent import productSearch
+
+    engine = productSearch()
+    samples = {stage: [] for stage in stages}
+    errors = 0
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=users) as executor:
+        futures = [executor.submit(run_user, engine, user, requests, unique) for user in range(users)]
+        for future in concurrent.futures.as_completed(futures):
+            for marks in future.result():
+                if isinstance(marks, Exception):
+                    errors += 1
+                    print(f"request failed: {marks}", file=sys.stderr)
+                    continue
+                for stage in stages:
+                    samples[stage].append(marks[stage])
+    elapsed = time.perf_counter() - start
+
+    completed = len(samples["total"])
+    return {
+        "users": users,
+        "requests": users * requests,
+        "completed": completed,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 3) if elapsed else 0.0,
+        "stages": {stage: percentiles(samples[stage]) for stage in stages if samples[stage]},
+        "stats": engine.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end latency benchmark.")
+    parser.add_argument("--users", type=int, default=4, help="concurrent users")
+    parser.add_argument("--requests", type=int, default=5, help="searches per user")
+    parser.add_argument("--latency", type=float, default=0.2, help="platform latency in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="chat-completions latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--unique", action="store_true", help="make every query unique to defeat caches")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-p95", action="append", default=[], metavar="STAGE=SECONDS",
+                        help="fail if the stage's p95 exceeds the limit, e.g. total=2.0")
+    args = parser.parse_args()
+
+    stubs, env = start_stubs(args.latency, args.llm_latency, args.jitter, args.error_rate,
+                             args.page_size, args.pages)
+    os.environ.update(env)
+    # Keep persisted plans from earlier runs out of the measurement.
+    os.environ["PLAN_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "plan_cache.db")
+    os.environ["MATCH_INDEX_PATH"] = os.path.join(tempfile.mkdtemp(), "match_index.db")
+    os.environ["CATALOG_PATH"] = os.path.join(tempfile.mkdtemp(), "catalog.db")
+
+    report = run(args.users, args.requests, args.unique)
+    for stub in stubs.values():
+        stub.stop()
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    for limit in args.max_p95:
+        stage, seconds = limit.split("=")
+        p95 = report["stages"].get(stage, {}).get("p95")
+        if p95 is None or p95 > float(seconds):
+            print(f"FAIL: {stage} p95 {p95} > {seconds}s", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Local stand-ins for the RapidAPI Amazon/Walmart search endpoints and the OpenAI
+chat-completions endpoint, with configurable latency, error rate and payload size.
+
+    python -m benchmarks.stubs --latency 0.3 --error-rate 0.05
+
+prints the environment variables that point the app at the stand-ins.
+"""
+import argparse
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+
+# STAND-IN SERVER
+class StubServer:
+    def __init__(self, kind: str, port: int = 0, latency: float = 0.2, jitter: float = 0.05,
+                 error_rate: float = 0.0, page_size: int = 20, pages: int = 3, token_delay: float = 0.005,
+                 quota: int = None):
+        """
+        kind is "amazon", "walmart" or "openai". Each request sleeps for latency +/- jitter
+        seconds and fails with HTTP 500 with probability error_rate. Search endpoints return
+        page_size products per page for the first `pages` pages, then an empty page.
+        With a quota, search responses carry RapidAPI's x-ratelimit-requests-* headers and
+        requests past the quota get HTTP 429.
+        """
+        self.kind = kind
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.pages = pages
+        self.token_delay = token_delay
+        self.quota = quota
+        self.requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name=f"stub-{self.kind}", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def delay(self):
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client cancelled the request, e.g. a page it no longer needs.
+                    pass
+
+            def send_json(self, status, body, headers=None):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def fail_randomly(self):
+                stub.requests += 1
+                stub.delay()
+                if random.random() < stub.error_rate:
+                    self.send_json(500, {"error": "injected failure"})
+                    return True
+                return False
+
+            def do_GET(self):
+                if self.fail_randomly():
+                    return
+                headers = None
+                if stub.quota is not None:
+                    remaining = max(0, stub.quota - stub.requests)
+                    headers = {"x-ratelimit-requests-limit": str(stub.quota),
+                               "x-ratelimit-requests-remaining": str(remaining),
+                               "x-ratelimit-requests-reset": "86400"}
+                    if stub.requests > stub.quota:
+                        self.send_json(429, {"message": "quota exceeded"}, {**headers, "Retry-After": "1"})
+                        return
+                url = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(url.query)
+                page = int(query.get("page", ["1"])[0])
+                term = (query.get("query") or query.get("q") or [""])[0]
+                products = search_products(stub.kind, term, page, stub.page_size) if page <= stub.pages else []
+                if stub.kind == "amazon":
+                    self.send_json(200, {"status": "OK", "data": {"products": products}}, headers)
+                else:
+                    self.send_json(200, {"searchResult": [products] if products else []}, headers)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if self.fail_randomly():
+                    return
+                calls = []
+                if body.get("tools"):
+                    content, calls = tool_reply(body.get("messages", []), body.get("tool_choice", "auto"))
+                else:
+                    content = chat_reply(body.get("messages", []))
+                if body.get("stream"):
+                    self.stream_reply(body, content, calls)
+                else:
+                    self.send_json(200, chat_completion(body, content, calls))
+
+            def stream_reply(self, body, content, calls=()):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for token in re.findall(r"\S+\s*", content or ""):
+                    time.sleep(stub.token_delay)
+                    self.write_event(chat_chunk(body, {"content": token}))
+                for index, call in enumerate(calls):
+                    self.write_event(chat_chunk(body, {"tool_calls": [{"index": index, **call}]}))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self.write_event({**chat_chunk(body, {}), "choices": [], "usage": usage(body, content or "")})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def write_event(self, event):
+                self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+        return Handler
+
+
+# PAYLOADS
+def search_products(kind, term, page, page_size):
+    """
+    Deterministic fake products for a query and page, shaped like the real responses.
+    """
+    rng = random.Random(f"{kind}:{term}:{page}")
+    products = []
+    for i in range(page_size):
+        price = round(rng.uniform(5, 250), 2)
+        name = f"{term.title() or 'Product'} {rng.choice(['Classic', 'Pro', 'Lite', 'Max'])} {page}-{i}"
+        days = rng.randint(1, 10)
+        arrival = datetime.date.today() + datetime.timedelta(days=days)
+        if kind == "amazon":
+            products.append({
+                "asin": f"B0{rng.randrange(10**8):08d}",
+                "product_title": name,
+                "product_price": f"${price:,.2f}",
+                "product_url": f"https://www.amazon.com/dp/B0{i:08d}",
+                "product_photo": f"https://m.media-amazon.com/images/I/{rng.randrange(10**6)}.jpg",
+                "product_star_rating": f"{rng.uniform(3, 5):.1f}",
+                "delivery": f"FREE delivery {arrival:%a, %b} {arrival.day} on $35 shipped by Amazon",
+            })
+        else:
+            products.append({
+                "usItemId": str(rng.randrange(10**9)),
+                "name": name,
+                "price": price,
+                "productLink": f"https://www.walmart.com/ip/{rng.randrange(10**9)}",
+                "image": f"https://i5.walmartimages.com/asr/{rng.randrange(10**6)}.jpg",
+                "rating": {"averageRating": round(rng.uniform(3, 5), 1)},
+                "fulfillmentBadgeGroups": [{"text": "Free shipping,",
+                                            "slaText": "arrives tomorrow" if days == 1 else f"arrives in {days} days"}],
+            })
+    return products
+
+
+def chat_reply(messages):
+    """
+    Planner-shaped reply for a user question, summary-shaped reply for an observation.
+    """
+    question = messages[-1]["content"] if messages else ""
+    if "Observation:" in question:
+        return ("Found matching products on both platforms. Prices range widely; the cheapest options "
+                "are listed first with ratings and delivery estimates.")
+    # Micro-batched planning prompt: one numbered section per question.
+    sections = re.findall(r"^### (\d+)\n- \*\*Question:\*\* (.*)$", question, re.M)
+    if sections:
+        return "\n\n".join(f"### {number}\n{plan_reply(text)}" for number, text in sections)
+    return plan_reply(question)
+
+
+def plan_params(question):
+    """
+    What a planner would pull out of the question: query, size and max_price.
+    """
+    max_price = re.search(r"(?:under|below|less than)\s*\$?(\d+)", question, re.I)
+    size = re.search(r"\bsize\s+(\w+)", question, re.I)
+    query = question
+    for match in (max_price, size):
+        if match:
+            query = query.replace(match.group(0), "")
+    # Like the real planner: keep model numbers and hyphenated words, drop other punctuation.
+    query = re.sub(r"\s+", " ", re.sub(r"[^\w\s'-]", " ", query)).strip()
+    return query[:40] or "product", size and size.group(1), max_price and int(max_price.group(1))
+
+
+def plan_reply(question):
+    tools = ["search_products : True"]
+    query, size, max_price = plan_params(question)
+    params = [f'query:"{query}"', 'platform:"all"']
+    if size:
+        params.append(f"size:{size}")
+    if max_price:
+        tools.append("price_filter : True")
+        params.append(f"max_price:{max_price}")
+    return ("- **Thought:** I should search for the product and apply the requested filters.\n"
+            f"- **Action:** necessary tools = {{{', '.join(tools)}}} | params = {{{', '.join(params)}}}")
+
+
+def tool_reply(messages, tool_choice):
+    """
+    Tool-calling reply: search calls for a new question, one retry with a broader query when
+    every search came back empty, otherwise an answer. Returns (content, tool calls).
+    """
+    last = messages[-1] if messages else {}
+    if last.get("role") != "tool":
+        query, size, max_price = plan_params(last.get("content") or "")
+        calls = [("search_products", {"query": query, "platform": "all", **({"size": size} if size else {})})]
+        if max_price:
+            calls.append(("price_filter", {"max_price": max_price}))
+    else:
+        results = [m["content"] for m in messages if m.get("role") == "tool" and " products" in m["content"]]
+        searched = [json.loads(call["function"]["arguments"]) for m in messages if m.get("tool_calls")
+                    for call in m["tool_calls"] if call["function"]["name"] == "search_products"]
+        broader = searched[-1]["query"].split()[1:] if searched else []
+        if tool_choice == "none" or not broader or any(re.search(r"[1-9]\d* products", r) for r in results):
+            return chat_reply([{"content": "Observation:"}]), []
+        calls = [("search_products", {**searched[-1], "query": " ".join(broader)})]
+    return None, [{"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                   "function": {"name": name, "arguments": json.dumps(arguments)}} for name, arguments in calls]
+
+
+def usage(body, content):
+    prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+def chat_completion(body, content, calls=()):
+    message = {"role": "assistant", "content": content}
+    if calls:
+        message["tool_calls"] = list(calls)
+    return {
+        "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if calls else "stop"}],
+        "usage": usage(body, content or json.dumps(list(calls))),
+    }
+
+
+def chat_chunk(body, delta):
+    return {
+        "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+    }
+
+
+def start_stubs(latency=0.2, llm_latency=0.5, jitter=0.05, error_rate=0.0, page_size=20, pages=3):
+    """
+    Start all three stand-ins and return them with the env vars that point the app at them.
+    """
+    stubs = {
+        "amazon": StubServer("amazon", latency=latency, jitter=jitter, error_rate=error_rate,
+                             page_size=page_size, pages=pages).start(),
+        "walmart": StubServer("walmart", latency=latency, jitter=jitter, error_rate=error_rate,
+                              page_size=page_size, pages=pages).start(),
+        "openai": StubServer("openai", latency=llm_latency, jitter=jitter, error_rate=error_rate).start(),
+    }
+    env = {
+        "AMAZON_API_URL": stubs["amazon"].url,
+        "WALMART_API_URL": stubs["walmart"].url,
+        "OPENAI_BASE_URL": stubs["openai"].url + "/v1",
+        "OPENAI_API_KEY": "stub",
+        "RAPID_API_KEY": "stub",
+    }
+    return stubs, env
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run offline stand-ins for RapidAPI and OpenAI.")
+    parser.add_argument("--latency", type=float, default=0.2, help="platform latency in seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="chat-completions latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3)
+    args = parser.parse_args()
+
+    stubs, env = start_stubs(args.latency, args.llm_latency, args.jitter, args.error_rate, args.page_size, args.pages)
+    for key, value in env.items():
+        print(f"export {key}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for stub in stubs.values():
+            stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Headless search API.
+
+    python server.py                     # SEARCH_API_WORKERS processes (1) on SEARCH_API_PORT (8000)
+    SEARCH_API_WORKERS=4 uvicorn server:app --workers 4
+
+Rate limits are per process and split between SEARCH_API_WORKERS, so set it to the
+number of worker processes however the server is started. /metrics, /stats and /health
+report the worker that answers; run one worker for whole-service numbers.
+
+POST /search          {"query": ..., "session_id": ...} -> one JSON response
+POST /search/stream   same body -> NDJSON, one productSearch.stream event per line
+GET  /products/{platform}/{product_id}/prices
+GET  /thumbnail?url=...&w=150   resized, cached product image
+GET  /stats, /metrics, /health
+"""
+from contextlib import asynccontextmanager
+import contextvars
+import json
+import logging
+import os
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+import uvicorn
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+# Concurrent text-planner requests in a worker are micro-batched within this window (PLANNER=text).
+os.environ.setdefault("PLAN_BATCH_WINDOW_MS", "20")
+
+from src.Agent import productSearch  # noqa: E402  (reads PLAN_BATCH_WINDOW_MS)
+from src.Metrics import metrics  # noqa: E402
+from src import Resilience  # noqa: E402
+from src import Thumbnail  # noqa: E402
+
+
+class SearchRequest(BaseModel):
+    query: str
+    session_id: str = "default"
+    # Seconds for the whole search; defaults to SEARCH_DEADLINE_S.
+    budget: float = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # One engine per worker process; its pools, caches and sessions are shared by every request.
+    app.state.engine = productSearch()
+    app.state.thumbnails = Thumbnail.from_env()
+    yield
+    app.state.thumbnails.close()
+
+
+app = FastAPI(title="Product Search API", lifespan=lifespan)
+
+
+def to_line(event):
+    return json.dumps(event, default=str) + "\n"
+
+
+@app.post("/search")
+async def search(body: SearchRequest, request: Request):
+    engine = request.app.state.engine
+    # The engine blocks on I/O, so it runs on the worker's thread pool, not the event loop.
+    event = await run_in_threadpool(engine.search_event, body.query, body.session_id, body.budget)
+    return {key: event[key] for key in ("tools", "products", "aggregated", "comparison", "observation", "partial", "stale")}
+
+
+@app.post("/search/stream")
+async def search_stream(body: SearchRequest, request: Request):
+    engine = request.app.state.engine
+
+    def events():
+        # Starlette advances the generator from different pool threads; run every step in
+        # one context so the search's trace spans stay open across steps.
+        context = contextvars.copy_context()
+        stream = engine.stream(body.query, body.session_id, body.budget)
+        try:
+            while True:
+                event = context.run(next, stream, None)
+                if event is None:
+                    break
+                yield to_line(event)
+        except Exception as error:
+            logger.error("search failed for %r: %s", body.query, error)
+            yield to_line({"type": "error", "error": str(error)})
+        finally:
+            # Also runs when the client disconnects, so the session lock is released.
+            context.run(stream.close)
+
+    # Starlette iterates a plain generator on its thread pool.
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.get("/products/{platform}/{product_id}/prices")
+async def price_history(platform: str, product_id: str, request: Request):
+    catalog = request.app.state.engine.tools.catalog
+    history = catalog.price_history(platform, product_id) if catalog else []
+    return {"platform": platform, "product_id": product_id,
+            "prices": [{"price": price, "seen": seen} for price, seen in history]}
+
+
+@app.get("/thumbnail")
+async def thumbnail(url: str, request: Request, w: int = 150):
+    thumbnails = request.app.state.thumbnails
+    try:
+        width = thumbnails.check(url, w)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    # Thumbnails never change for a given URL and width, so the ETag is known up front.
+    headers = {"ETag": thumbnails.etag(url, width), "Cache-Control": "public, max-age=604800, immutable"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    try:
+        data = await run_in_threadpool(thumbnails.get, url, width)
+    except Exception as error:
+        logger.warning("thumbnail failed for %s: %r", url, error)
+        raise HTTPException(status_code=502, detail="Image unavailable")
+    return Response(content=data, media_type=thumbnails.media_type, headers=headers)
+
+
+@app.get("/stats")
+async def stats(request: Request, session_id: str = None):
+    return {**request.app.state.engine.stats(session_id), "thumbnails": request.app.state.thumbnails.stats()}
+
+
+@app.get("/metrics")
+async def export_metrics():
+    return PlainTextResponse(metrics.export_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    # Degraded while any upstream circuit is open; the service still answers with partial results.
+    circuits = Resilience.health()
+    degraded = any(circuit["state"] == "open" for circuit in circuits.values())
+    return {"status": "degraded" if degraded else "ok", "circuits": circuits}
+
+
+if __name__ == "__main__":
+    uvicorn.run("server:app", host=os.getenv("SEARCH_API_HOST", "0.0.0.0"),
+                port=int(os.getenv("SEARCH_API_PORT", 8000)),
+                workers=int(os.getenv("SEARCH_API_WORKERS", 1)))
@@ -1,54 +1,386 @@
 
+from collections import OrderedDict
+import hashlib
+import json
+import logging
 import re
 import os
+import threading
 
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APIConnectionError, BadRequestError, InternalServerError, OpenAI, RateLimitError
 
-from src.prompt import react_style_prompt
-from src.template import all_tools
+from src.Cache import ResultCache, normalize_query
+from src.Deadline import Deadline
+from src.Metrics import metrics
+from src.Observation import count_tokens, encode_observation
+from src.Pipeline import aggregate_products, merge_results
+from src.Planner import PlanBatcher, Speculation, action_key, plan_calls, render_plan, search_calls
+from src.prompt import react_style_prompt, tool_calling_prompt
+from src import RateLimit, Resilience
+from src.SingleFlight import SingleFlight
+from src.template import all_tools, tool_specs
 from src.Tool import Tools
 
 load_dotenv(".env")
+
+logger = logging.getLogger(__name__)
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
+# Identical in-flight completions from concurrent sessions share one OpenAI call.
+llm_flight = SingleFlight("llm")
+# OpenAI errors worth retrying; APITimeoutError is an APIConnectionError.
+llm_errors = (APIConnectionError, InternalServerError, RateLimitError)
+# Circuit breaker and budgeted retries for OpenAI. Completions are not hedged, they cost tokens.
+llm_resilience = Resilience.from_env("openai", lambda error: isinstance(error, llm_errors))
+# What an answer step gives up on, keeping the products already fetched.
+answer_errors = (*llm_errors, Resilience.CircuitOpenError)
+
+
+def llm_options(deadline):
+    """
+    Per-call OpenAI options: the request times out with the deadline.
+    """
+    timeout = deadline.timeout() if deadline else None
+    return {"timeout": timeout} if timeout is not None else {}
+
+
 class ecommerceAgent:
-    def __init__(self, system=""):
+    def __init__(self, system="", max_turns=4, max_context_tokens=6000):
         self.system = system
+        # Only the system prompt plus the last max_turns user/assistant pairs are kept,
+        # and never more than max_context_tokens in total.
+        self.max_turns = max_turns
+        self.max_context_tokens = max_context_tokens
         self.messages = []
         if self.system:
             self.messages.append({"role": "system", "content": system})
+        # Token usage reported by the API, per call and in total.
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.last_usage = {}
+        # A conversation is one ordered thread; concurrent queries in the same session take turns.
+        self.lock = threading.Lock()
 
-    def __call__(self, message):
+    def __call__(self, message, deadline=None):
         self.messages.append({"role": "user", "content": message})
-        result = self.execute()
+        self.trim()
+        result = self.execute(deadline)
         self.messages.append({"role": "assistant", "content": result})
         return result
 
-    def execute(self):
-        client = OpenAI()
+    def trim(self):
+        """
+        Bound the context: compact every observation but the latest, keep the last
+        max_turns turns, then drop the oldest messages until under the token budget.
+        """
+        head = self.messages[:1] if self.system else []
+        history = self.messages[len(head):]
+
+        observations = [i for i, m in enumerate(history) if m["role"] == "user" and "Observation:" in m["content"]]
+        for i in observations[:-1]:
+            content = history[i]["content"]
+            if not content.endswith("[compacted]"):
+                history[i] = {"role": "user", "content": content[:content.index("Observation:")] + "Observation: [compacted]"}
+
+        history = history[-(self.max_turns * 2 + 1):]
+        budget = self.max_context_tokens - sum(count_tokens(m["content"]) for m in head)
+        while len(history) > 1 and sum(count_tokens(m["content"]) for m in history) > budget:
+            history.pop(0)
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=self.messages,
-            temperature=0.01
-        )
+        self.messages = head + history
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        self.calls += 1
+        self.prompt_tokens += usage.prompt_tokens
+        self.completion_tokens += usage.completion_tokens
+        self.last_usage = {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+        metrics.inc("llm_tokens_total", usage.prompt_tokens, kind="prompt")
+        metrics.inc("llm_tokens_total", usage.completion_tokens, kind="completion")
+
+    def usage(self):
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "prompt_tokens_per_call": round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0,
+            "last_call": self.last_usage,
+        }
+
+    def execute(self, deadline=None):
+        key = hashlib.sha1(json.dumps(self.messages, sort_keys=True).encode("utf-8")).hexdigest()
+        return llm_flight.do(key, lambda: self.complete(deadline))
+
+    def complete(self, deadline=None):
+        # Retries are left to llm_resilience so they respect its budget and the deadline.
+        client = OpenAI(max_retries=0)
+
+        with metrics.span("llm", model="gpt-4o-mini"):
+            response = llm_resilience.call(lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self.messages,
+                temperature=0.01,
+                **llm_options(deadline)
+            ), deadline)
+        self.record_usage(response.usage)
         
         return response.choices[0].message.content
 
+    def stream(self, message, deadline=None):
+        """
+        Like __call__, but yield the reply token by token as it arrives.
+        The reply is cut off when the deadline passes.
+        """
+        self.messages.append({"role": "user", "content": message})
+        self.trim()
+        client = OpenAI(max_retries=0)
+
+        # Timed until the response starts streaming; the caller's span covers the rest.
+        # Only opening the stream is retried, never a partly streamed reply.
+        with metrics.span("llm", model="gpt-4o-mini", stream=True):
+            response = llm_resilience.call(lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=self.messages,
+                temperature=0.01,
+                stream=True,
+                stream_options={"include_usage": True},
+                **llm_options(deadline)
+            ), deadline)
+
+        result = ""
+        for chunk in response:
+            if deadline and deadline.expired():
+                response.close()
+                break
+            # The final chunk carries no choices, only the usage totals.
+            if chunk.usage:
+                self.record_usage(chunk.usage)
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                result += token
+                yield token
+        self.messages.append({"role": "assistant", "content": result})
+
+    def call_tools(self, messages, tools, deadline=None, tool_choice="auto"):
+        """
+        One structured tool-calling turn on the given messages; the session history is left as is.
+        Returns the reply text and its tool calls as [{"id", "name", "arguments"}].
+        Identical concurrent turns share one completion.
+        """
+        content, calls = llm_flight.do(tool_call_key(messages, tools, tool_choice),
+                                       lambda: self.complete_tools(messages, tools, deadline, tool_choice))
+        return content, [dict(call) for call in calls]
+
+    def complete_tools(self, messages, tools, deadline=None, tool_choice="auto"):
+        client = OpenAI(max_retries=0)
+
+        with metrics.span("llm", model="gpt-4o-mini", tools=True):
+            response = llm_resilience.call(lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                temperature=0.01,
+                **llm_options(deadline)
+            ), deadline)
+        self.record_usage(response.usage)
+
+        message = response.choices[0].message
+        calls = [{"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+                 for call in message.tool_calls or []]
+        return message.content or "", calls
+
+    def stream_tools(self, messages, tools, calls, deadline=None, tool_choice="auto"):
+        """
+        Streaming call_tools: yield the reply token by token and append its tool calls,
+        assembled from the streamed fragments, to `calls`. Identical concurrent turns share one stream.
+        """
+        for item in llm_flight.stream(tool_call_key(messages, tools, tool_choice),
+                                      lambda: self.complete_tools_stream(messages, tools, deadline, tool_choice)):
+            # Text tokens, then the list of tool calls as the last item.
+            if isinstance(item, list):
+                calls.extend(dict(call) for call in item)
+            else:
+                yield item
+
+    def complete_tools_stream(self, messages, tools, deadline=None, tool_choice="auto"):
+        client = OpenAI(max_retries=0)
+
+        with metrics.span("llm", model="gpt-4o-mini", tools=True, stream=True):
+            response = llm_resilience.call(lambda: client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                tools=tools,
+                tool_choice=tool_choice,
+                temperature=0.01,
+                stream=True,
+                stream_options={"include_usage": True},
+                **llm_options(deadline)
+            ), deadline)
+
+        fragments = {}
+        for chunk in response:
+            if deadline and deadline.expired():
+                response.close()
+                break
+            if chunk.usage:
+                self.record_usage(chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            for call in delta.tool_calls or []:
+                fragment = fragments.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                fragment["id"] = call.id or fragment["id"]
+                if call.function:
+                    fragment["name"] += call.function.name or ""
+                    fragment["arguments"] += call.function.arguments or ""
+            if delta.content:
+                yield delta.content
+        yield [fragments[index] for index in sorted(fragments)]
+
+def tool_call_key(messages, tools, tool_choice):
+    """
+    Single-flight key for a tool-calling completion.
+    """
+    body = {"messages": messages, "tools": tools, "tool_choice": tool_choice}
+    return hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
 class productSearch:
-    """"""
-    def __init__(self):
-        self.bot = ecommerceAgent(react_style_prompt)    
+    """
+    Shared search engine. Platform tools are stateless and shared by every user,
+    each query runs in its own RequestContext, and each session gets its own
+    ecommerceAgent so conversations never mix.
+    """
+    def __init__(self, max_sessions=1000):
         self.tools = Tools()
+        # Parsed plans keyed on the normalized query, persisted across restarts.
+        self.plan_cache = ResultCache(ttl=float(os.getenv("PLAN_CACHE_TTL", 86400)),
+                                      max_size=int(os.getenv("PLAN_CACHE_SIZE", 10000)),
+                                      path=os.getenv("PLAN_CACHE_PATH", "plan_cache.db"), name="plan")
+        # End-to-end latency budget per search; the platform stage stops early enough to
+        # leave summary_reserve seconds for the summary. 0 disables the deadline.
+        self.deadline_budget = float(os.getenv("SEARCH_DEADLINE_S", 10)) or None
+        self.summary_reserve = float(os.getenv("SUMMARY_RESERVE_S", 1.0))
+        # Token budget for the observation sent to the summary call.
+        self.observation_budget = int(os.getenv("OBSERVATION_TOKEN_BUDGET", 400))
+        self.observation_stats = {"encoded": 0, "tokens": 0, "saved_tokens": 0}
+        # Start platform searches from a local reading of the question while the planner runs.
+        self.speculative = os.getenv("SPECULATIVE_FETCH", "1") != "0"
+        self.speculation_stats = {"hit": 0, "miss": 0, "unused": 0}
+        # Structured tool-calling planner ("tools") or the free-text Action planner ("text"),
+        # which is also the fallback when a tool-calling reply has no usable search.
+        self.planner = os.getenv("PLANNER", "tools")
+        # Tool-calling loop budget: LLM steps per search, the plan and the answer included.
+        self.max_steps = max(2, int(os.getenv("REACT_MAX_STEPS", 3)))
+        self.react_stats = {"searches": 0, "steps": 0, "tool_calls": 0, "answered": 0, "forced": 0, "fallbacks": 0}
+        # Concurrent text-plan cache misses are micro-batched into fewer LLM calls when a window is set.
+        batch_window = float(os.getenv("PLAN_BATCH_WINDOW_MS", 0)) / 1000
+        self.batcher = (PlanBatcher(self.plan_once, batch_window, int(os.getenv("PLAN_BATCH_SIZE", 8)))
+                        if batch_window > 0 and self.planner == "text" else None)
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self.sessions_lock = threading.Lock()
 
-    def search(self, question):
+    def session(self, session_id):
+        """
+        Return the agent for a session, evicting the least recently used one when full.
+        """
+        with self.sessions_lock:
+            bot = self.sessions.get(session_id)
+            if bot is None:
+                bot = self.sessions[session_id] = ecommerceAgent(react_style_prompt)
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return bot
+
+    def close_session(self, session_id):
+        """
+        Forget a session, e.g. a one-off batch query.
+        """
+        with self.sessions_lock:
+            self.sessions.pop(session_id, None)
+
+    def plan(self, question, bot, deadline=None, on_miss=None):
+        """
+        Ask the agent for an action plan: a list of independent (tools, params) actions, plus
+        the tool calls they came from (None for a text plan, which has no further steps).
+        Repeat and near-repeat queries are answered from the plan cache.
+        on_miss() is called before going to the LLM, e.g. to start a speculative search.
+        """
         
-        next_prompt = question
-        result = self.bot(next_prompt)
+        with metrics.span("plan") as span:
+            key = normalize_query(question)
+            cached = self.plan_cache.get(key)
+            span.set(cached=cached is not None)
+            if cached is not None:
+                # Record the turn so the session's conversation stays coherent.
+                self.record_turn(bot, question, cached["result"])
+                calls = cached.get("calls")
+                return (plan_calls(calls) if calls else [(cached["tools"], cached["params"])]), calls
+
+            if on_miss:
+                on_miss()
+            calls = self.plan_tools(question, bot, deadline) if self.planner == "tools" else None
+            if calls:
+                actions = plan_calls(calls)
+                result = render_plan(actions)
+                self.record_turn(bot, question, result)
+            elif self.batcher:
+                result = self.batcher.plan(question, deadline)
+                self.record_turn(bot, question, result)
+            else:
+                result = bot(question, deadline)
+            span.set(structured=calls is not None)
+
+        logger.debug("Model Response %s", result)
+        if calls is None:
+            actions = [self.parse_plan(result)]
+        necessary_tools, params = actions[0]
+        self.plan_cache.set(key, {"result": result, "tools": necessary_tools, "params": params, "calls": calls})
+        return actions, calls
+
+    def plan_tools(self, question, bot, deadline=None):
+        """
+        First step of the tool-calling loop. Returns the tool calls, or None to fall back
+        to the text planner when tool calling is unavailable or nothing would be searched.
+        """
+        try:
+            _, calls = bot.call_tools(self.tool_messages(bot, [{"role": "user", "content": question}]),
+                                      tool_specs, deadline)
+        except BadRequestError as error:
+            logger.warning("Tool calling rejected, using the text planner: %s", error)
+            calls = []
+        if plan_calls(calls):
+            return calls
+        self.react_stats["fallbacks"] += 1
+        return None
+
+    def tool_messages(self, bot, messages):
+        """
+        The session's history under the tool-calling system prompt, followed by messages.
+        """
+        return [{"role": "system", "content": tool_calling_prompt},
+                *bot.messages[1 if bot.system else 0:], *messages]
 
-        print("Model Response ",result)
+    def record_turn(self, bot, message, reply):
+        bot.messages.append({"role": "user", "content": message})
+        bot.messages.append({"role": "assistant", "content": reply})
+        bot.trim()
 
+    def plan_once(self, prompt, deadline=None):
+        """
+        Stateless planning call used by the batcher; the session records the turn itself.
+        """
+        return ecommerceAgent(react_style_prompt)(prompt, deadline)
+
+    def parse_plan(self, result):
+        """
+        Parse the agent's Action line into tool flags and params.
+        """
         tools_params = [i.replace("**Action:**",'').strip() for i in result.split('\n') if i != "" and "**Action:**" in i ][0]
 
         necessary_tools  = {k : True  if k in result else  False  for k,v in all_tools.items()}
@@ -58,16 +390,242 @@ class productSearch:
 
         # Convert matches to a dictionary
         params = {k: v.strip('"') if v.startswith('"') else int(v) for k, v in matches}
+        return necessary_tools, params
+
+    def summary_prompt(self, products):
+        """
+        Build the summary prompt from a compact, token-budgeted encoding of the results.
+        """
+        observation, report = encode_observation(products, self.observation_budget)
+        self.observation_stats["encoded"] += 1
+        self.observation_stats["tokens"] += report["tokens"]
+        self.observation_stats["saved_tokens"] += report["saved_tokens"]
+        return " Summarize the below Observation in 300 characters in structured format:\n Observation: {}".format(observation)
+
+    def deadline(self, budget=None):
+        """
+        Deadline for one search; a budget of 0 means no deadline.
+        """
+        return Deadline((budget if budget is not None else self.deadline_budget) or None)
+
+    def speculation(self, question, deadline):
+        """
+        Speculative platform search for a plan-cache miss, or None when disabled.
+        """
+        if not self.speculative:
+            return None
+        return Speculation(self.tools, question, deadline, self.speculation_stats)
+
+    def summarize(self, bot, products, deadline):
+        """
+        Blocking summary call; empty when the deadline leaves no time for it.
+        """
+        if deadline.expired():
+            logger.warning("no time left for the summary")
+            return ""
+        try:
+            return bot(self.summary_prompt(products), deadline)
+        except answer_errors as error:
+            logger.warning("summary failed: %r", error)
+            return ""
+
+    def run(self, question, session_id="default", budget=None, stream=True):
+        """
+        One search within `budget` seconds (SEARCH_DEADLINE_S by default): plan, run the
+        planned actions in parallel, then answer, either streaming the answer or not.
+        Yields the events documented in stream().
+        """
+        deadline = self.deadline(budget)
+        fetch_deadline = deadline.reserve(self.summary_reserve)
+        bot = self.session(session_id)
+        with bot.lock, metrics.span("search", mode="stream" if stream else "blocking") as root:
+            speculation = self.speculation(question, fetch_deadline)
+            actions, calls = self.plan(question, bot, deadline, speculation and speculation.start)
+            necessary_tools, params = actions[0]
+            yield {"type": "plan", "tools": necessary_tools, "params": params,
+                   "actions": [{"tools": tools, "params": params} for tools, params in actions],
+                   "trace": root.traceparent()}
+
+            products = {}
+            prefetched = speculation.reconcile(params, necessary_tools) if speculation else None
+            results = yield from self.dispatch(actions, products, fetch_deadline, prefetched)
+            if calls is None:
+                observation = yield from self.answer(bot, products, deadline, stream)
+            else:
+                observation = yield from self.react(bot, calls, actions, results, products,
+                                                    deadline, fetch_deadline, stream)
+
+            yield {"type": "done", "products": products, "tools": necessary_tools, "observation": observation,
+                   "aggregated": aggregate_products(products), "comparison": self.comparison(actions, products, deadline),
+                   "partial": any(result.get('partial') for result in products.values()),
+                   "stale": any(result.get('stale') for result in products.values())}
+
+    def comparison(self, actions, products, deadline):
+        """
+        Matched price pairs when an action asked for price_comparison, else [].
+        """
+        if not any(tools.get('price_comparison') for tools, _ in actions):
+            return []
+        return self.tools.compare(products, deadline)
+
+    def dispatch(self, actions, products, deadline, prefetched=None):
+        """
+        Run independent actions in parallel, merging each platform into products as it
+        finishes and yielding a platform event for it. Returns each action's own results.
+        """
+        results = [{} for _ in actions]
         try:
-            products = self.tools.main(params, necessary_tools)
+            for index, platform, result in self.tools.stream_actions(actions, deadline, prefetched):
+                results[index][platform] = result
+                yield {"type": "platform", "platform": platform, "result": merge_results(products, platform, result),
+                       "aggregated": aggregate_products(products)}
         except Exception as error :
-            print("error while fetching the product from ther platforms :", error)
-            products = { "walmart" : {"products" :[]}, "amazon" :{"products" :[]}}
+            logger.error("error while fetching the product from the platforms: %s", error)
+            for platform in ("walmart", "amazon"):
+                products.setdefault(platform, {"products": []})
+        return results
 
-        next_prompt = " Summarize the below Observation in 300 characters in structured format:\n Observation: {}".format(products)
-        
-        observation = self.bot(next_prompt)
+    def answer(self, bot, products, deadline, stream=True):
+        """
+        Summary of a text plan's results, streamed as summary events or made in one call.
+        """
+        observation = ""
+        with metrics.span("summary"):
+            if not stream:
+                return self.summarize(bot, products, deadline)
+            try:
+                if not deadline.expired():
+                    for token in bot.stream(self.summary_prompt(products), deadline):
+                        observation += token
+                        yield {"type": "summary", "token": token}
+            except answer_errors as error:
+                logger.warning("summary failed: %r", error)
+        return observation
+
+    def react(self, bot, calls, actions, results, products, deadline, fetch_deadline, stream=True):
+        """
+        The rest of the tool-calling loop once the planned actions have run. Every step shows
+        the model the observation of each call; it either answers, which ends the loop early,
+        or calls more tools, whose new actions run in parallel. The answer is forced, with no
+        tools allowed, once the step budget or the fetch deadline is used up or a step repeats
+        only earlier actions. Returns the answer and records the turn in the session.
+        """
+        self.react_stats["searches"] += 1
+        messages = self.tool_messages(bot, [])[:-1]
+        observed = {action_key(action): result for action, result in zip(actions, results)}
+        step, fresh, answer = 1, True, ""
+        with metrics.span("summary") as span:
+            while True:
+                self.react_stats["steps"] += 1
+                self.react_stats["tool_calls"] += len(calls)
+                messages.append({"role": "assistant", "content": None, "tool_calls": [
+                    {"id": call["id"], "type": "function",
+                     "function": {"name": call["name"], "arguments": call["arguments"]}} for call in calls]})
+                messages.extend(self.tool_results(calls, observed))
+                step += 1
+                if deadline.expired():
+                    logger.warning("no time left for the answer")
+                    break
+                final = step >= self.max_steps or fetch_deadline.expired() or not fresh
+                tool_choice = "none" if final else "auto"
+
+                calls, answer = [], ""
+                try:
+                    if stream:
+                        for token in bot.stream_tools(messages, tool_specs, calls, deadline, tool_choice):
+                            answer += token
+                            yield {"type": "summary", "token": token}
+                    else:
+                        answer, calls = bot.call_tools(messages, tool_specs, deadline, tool_choice)
+                except answer_errors as error:
+                    logger.warning("answer failed: %r", error)
+                    break
+                actions = plan_calls(calls) if not final else []
+                if not actions:
+                    self.react_stats["forced" if final else "answered"] += 1
+                    break
+
+                new = [action for action in actions if action_key(action) not in observed]
+                fresh = bool(new)
+                yield {"type": "step", "step": step, "thought": answer,
+                       "actions": [{"tools": tools, "params": params} for tools, params in new]}
+                results = yield from self.dispatch(new, products, fetch_deadline)
+                observed.update((action_key(action), result) for action, result in zip(new, results))
+            span.set(steps=step)
+
+        self.record_turn(bot, self.summary_prompt(products), answer)
+        return answer
+
+    def tool_results(self, calls, observed):
+        """
+        One tool message per call: a search gets the compact observation of its own results,
+        a filter is reported as applied to the searches of its step.
+        """
+        actions = iter(plan_calls(calls))
+        searches = {id(call) for call in search_calls(calls)}
+        budget = max(100, self.observation_budget // max(1, len(searches)))
+        messages = []
+        for call in calls:
+            if id(call) in searches:
+                content, _ = encode_observation(observed.get(action_key(next(actions)), {}), budget)
+            else:
+                content = "Applied to the search results of this step."
+            messages.append({"role": "tool", "tool_call_id": call["id"], "content": content or "No products found."})
+        return messages
+
+    def stream(self, question, session_id="default", budget=None):
+        """
+        Streaming search within `budget` seconds (SEARCH_DEADLINE_S by default).
+        Yields events as they become ready:
+          {"type": "plan", "tools": ..., "params": ..., "actions": ...}
+          {"type": "platform", "platform": ..., "result": ..., "aggregated": ...}   one per platform, fastest first
+          {"type": "step", "step": ..., "thought": ..., "actions": ...}             the model asked for more searches;
+                                                                                    summary tokens so far were its thought
+          {"type": "summary", "token": ...}                                        the answer, token by token
+          {"type": "done", "products": ..., "tools": ..., "observation": ..., "aggregated": ..., "comparison": ...,
+           "partial": ..., "stale": ...}
+        Platforms that miss the deadline come back empty with "partial": True. Platforms answered
+        from the catalog are flagged "stale": True with the products' "age_s".
+        """
+        return self.run(question, session_id, budget, stream=True)
+
+    def search(self, question, session_id="default", budget=None):
+        """
+        Blocking search: plan, run the tools, summarise, within `budget` seconds.
+        """
+        event = self.search_event(question, session_id, budget)
+        return event["products"], event["tools"], event["observation"]
 
-        return products, necessary_tools, observation
+    def search_event(self, question, session_id="default", budget=None):
+        """
+        Blocking search returning its "done" event, comparison and aggregate included.
+        """
+        for event in self.run(question, session_id, budget, stream=False):
+            pass
+        return event
 
+    def stats(self, session_id=None):
+        """
+        Cache and request-coalescing counters for the LLM and platform calls,
+        plus token usage for the given session.
+        """
+        stats = {
+            "plan_cache": self.plan_cache.stats(),
+            "search_cache": self.tools.cache.stats(),
+            "search_dedup": self.tools.flight.stats(),
+            "matching": self.tools.matches.stats(),
+            "catalog": self.tools.catalog.stats() if self.tools.catalog else None,
+            "llm_dedup": llm_flight.stats(),
+            "plan_batching": self.batcher.stats() if self.batcher else None,
+            "observation": self.observation_stats,
+            "sessions": len(self.sessions),
+            "health": Resilience.health(),
+            "rate_limits": RateLimit.stats(),
+            "react": self.react_stats,
+            "speculation": {**self.speculation_stats, "hit_rate": round(
+                self.speculation_stats["hit"] / max(1, self.speculation_stats["hit"] + self.speculation_stats["miss"]), 3)},
+        }
+        if session_id in self.sessions:
+            stats["tokens"] = self.sessions[session_id].usage()
+        return stats
     
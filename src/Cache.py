@@ -0,0 +1,152 @@
+from collections import OrderedDict
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from src.Metrics import metrics
+
+
+def canonical_params(params: dict):
+    """
+    Canonical form of a params dict: sorted keys, empty values dropped,
+    values lower-cased with whitespace collapsed.
+    """
+    canonical = {}
+    for key in sorted(params):
+        value = params[key]
+        if value is None or value == "":
+            continue
+        canonical[key] = re.sub(r"\s+", " ", str(value)).strip().lower()
+    return json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+
+
+def normalize_query(query: str):
+    """
+    Normalize a user query so near-repeats share a key: case, whitespace,
+    punctuation and number formats ("$1,200.00" -> "1200").
+    """
+    query = query.lower()
+    # Drop thousands separators and currency symbols, then trailing zero decimals.
+    query = re.sub(r"(?<=\d),(?=\d{3})", "", query)
+    query = re.sub(r"[$€£₹]", " ", query)
+    query = re.sub(r"(\d+)\.0+\b", r"\1", query)
+    # Keep decimal points inside numbers, replace any other punctuation with spaces.
+    query = re.sub(r"(?!(?<=\d)\.(?=\d))[^\w\s]", " ", query)
+    return re.sub(r"\s+", " ", query).strip()
+
+
+# RESULT CACHE
+class ResultCache:
+    def __init__(self, ttl: float = 300.0, max_size: int = 512, path: str = None, name: str = "cache",
+                 stale_ttl: float = 0.0):
+        """
+        TTL + LRU cache for JSON-serialisable results.
+        Entries are kept in process memory, or in a SQLite file when a path is given.
+        Expired entries stay readable with get(key, stale=True) for another stale_ttl seconds.
+        """
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        # Disk hits refresh the LRU access time at most this often, so most hits are read-only.
+        self.touch_interval = min(60.0, ttl / 4)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._db = None
+        if path:
+            # Several server workers may share the file: readers must not block on a writer.
+            self._db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache ("
+                             "key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)")
+            self._db.commit()
+
+    def get(self, key: str, stale: bool = False):
+        """
+        Return the cached value, or None on a miss or an expired entry.
+        With stale=True an expired entry is still returned within its stale window.
+        """
+        now = time.time()
+        with self._lock:
+            value = self._get_disk(key, now, stale) if self._db else self._get_memory(key, now, stale)
+            if value is None:
+                self.misses += 1
+                result = "miss"
+            elif stale:
+                self.stale_hits += 1
+                result = "stale"
+            else:
+                self.hits += 1
+                result = "hit"
+        metrics.inc("cache_requests_total", cache=self.name, result=result)
+        return value
+
+    def set(self, key: str, value):
+        now = time.time()
+        with self._lock:
+            if self._db:
+                self._set_disk(key, value, now)
+            else:
+                self._set_memory(key, value, now)
+
+    def _get_memory(self, key, now, stale=False):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires + self.stale_ttl < now:
+            del self._memory[key]
+            return None
+        if expires < now and not stale:
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _set_memory(self, key, value, now):
+        self._memory[key] = (now + self.ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _get_disk(self, key, now, stale=False):
+        row = self._db.execute("SELECT value, expires, accessed FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] + self.stale_ttl < now:
+            self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        if row[1] < now and not stale:
+            return None
+        if now - row[2] >= self.touch_interval:
+            self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def _set_disk(self, key, value, now):
+        self._db.execute("INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value), now + self.ttl, now))
+        # Evict expired entries first, then the least recently used ones.
+        self._db.execute("DELETE FROM cache WHERE expires < ?", (now - self.stale_ttl,))
+        self._db.execute("DELETE FROM cache WHERE key NOT IN "
+                         "(SELECT key FROM cache ORDER BY accessed DESC LIMIT ?)", (self.max_size,))
+        self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "stale_hits": self.stale_hits,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
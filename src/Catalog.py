@@ -0,0 +1,221 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from src.Metrics import metrics
+from src.Product import ProductBatch
+from src.RateLimit import current_priority
+from src.template import product_output_format
+
+logger = logging.getLogger(__name__)
+
+# Stored columns: product_output_format plus the delivery date parsed at ingest.
+catalog_columns = (*product_output_format, "delivery_date")
+
+
+def fts_query(query: str):
+    """
+    FTS5 query matching every word of the search query, in any order.
+    """
+    words = re.findall(r"\w+", query.lower())
+    return " ".join(f'"{word}"' for word in words)
+
+
+# PRODUCT CATALOG
+class Catalog:
+    def __init__(self, path: str = None, fresh_ttl: float = 3600.0, stale_ttl: float = 86400.0):
+        """
+        On-disk catalog of every formatted product the platforms return, with a full-text
+        index on names, the product keys each search returned, and price history.
+        A search is answered locally when the catalog saw it (or, through the full-text index,
+        enough matching products) within fresh_ttl + stale_ttl seconds; past fresh_ttl the
+        search is also refreshed in the background. Writes run on one background thread.
+        """
+        self.path = path
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.counts = {"exact": 0, "fulltext": 0, "misses": 0, "offline": 0, "refreshes": 0, "ingested": 0}
+        self.refreshing = set()
+        self.tasks = set()
+        self._lock = threading.Lock()
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog")
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        # Untyped columns keep values as given (e.g. an integer size).
+        columns = ", ".join(f"{name} REAL" if name in ("price", "ratings") else name for name in catalog_columns
+                            if name != "name")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS products (key TEXT PRIMARY KEY, name TEXT, {columns}, "
+                         "first_seen REAL, updated REAL)")
+        # Catalogs written before a column was added get it, empty.
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(products)")}
+        for name in catalog_columns:
+            if name not in existing:
+                self._db.execute(f"ALTER TABLE products ADD COLUMN {name}")
+        self._db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+                         "name, content='products', content_rowid='rowid')")
+        self._db.execute("CREATE TABLE IF NOT EXISTS searches (search_key TEXT PRIMARY KEY, query TEXT, fetched REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS search_results ("
+                         "search_key TEXT, rank INTEGER, key TEXT, PRIMARY KEY (search_key, rank))")
+        self._db.execute("CREATE TABLE IF NOT EXISTS price_history (key TEXT, price REAL, seen REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS price_history_key ON price_history (key, seen)")
+        self._db.commit()
+
+    # Writes
+    def ingest(self, products: ProductBatch, search_key: str = None, query: str = None):
+        """
+        Queue products for storage. With a search_key they are also recorded as that
+        search's complete result; pass none for results cut short by the deadline.
+        """
+        rows = products.to_dicts()
+        future = self.writer.submit(self._ingest, rows, search_key, query, time.time())
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future):
+        if future.exception() is not None:
+            logger.error("Catalog ingest failed: %r", future.exception())
+
+    def _ingest(self, rows: list, search_key, query, now):
+        with self._lock, metrics.span("catalog_ingest") as span:
+            keys = []
+            for row in rows:
+                key = f"{row['platform']}:{row.get('product_id') or row.get('product_url')}"
+                keys.append(key)
+                values = [row.get(name) for name in catalog_columns]
+                existing = self._db.execute("SELECT rowid, name, price FROM products WHERE key = ?", (key,)).fetchone()
+                if existing is None:
+                    cursor = self._db.execute(
+                        f"INSERT INTO products (key, {', '.join(catalog_columns)}, first_seen, updated) "
+                        f"VALUES (?, {', '.join('?' * len(catalog_columns))}, ?, ?)", (key, *values, now, now))
+                    self._db.execute("INSERT INTO products_fts (rowid, name) VALUES (?, ?)", (cursor.lastrowid, row.get("name")))
+                else:
+                    rowid, name, price = existing
+                    self._db.execute(f"UPDATE products SET {', '.join(f'{c} = ?' for c in catalog_columns)}, updated = ? "
+                                     "WHERE rowid = ?", (*values, now, rowid))
+                    if name != row.get("name"):
+                        # External-content FTS: remove the old text before adding the new one.
+                        self._db.execute("INSERT INTO products_fts (products_fts, rowid, name) VALUES ('delete', ?, ?)",
+                                         (rowid, name))
+                        self._db.execute("INSERT INTO products_fts (rowid, name) VALUES (?, ?)", (rowid, row.get("name")))
+                    if price == row.get("price"):
+                        continue
+                if row.get("price") is not None:
+                    self._db.execute("INSERT INTO price_history (key, price, seen) VALUES (?, ?, ?)",
+                                     (key, row["price"], now))
+            if search_key:
+                self._db.execute("INSERT OR REPLACE INTO searches (search_key, query, fetched) VALUES (?, ?, ?)",
+                                 (search_key, query, now))
+                self._db.execute("DELETE FROM search_results WHERE search_key = ?", (search_key,))
+                self._db.executemany("INSERT INTO search_results (search_key, rank, key) VALUES (?, ?, ?)",
+                                     [(search_key, rank, key) for rank, key in enumerate(keys)])
+            self._db.commit()
+            self.counts["ingested"] += len(rows)
+            span.set(products_in=len(rows))
+
+    # Reads
+    def lookup(self, search_key: str, platform: str, query: str, max_price=None, min_results: int = 20,
+               max_age: float = None, fulltext: bool = True):
+        """
+        Local answer for a search as (ProductBatch, age in seconds), or None; the batch carries the age.
+        The exact search is used when it was fetched within max_age (fresh_ttl + stale_ttl by
+        default); otherwise, if fulltext, the full-text index answers when it finds at least
+        min_results products on the platform, within max_price, all updated within max_age.
+        Pass fulltext=False for searches with filters (size, brand, ...) the index cannot check.
+        """
+        now = time.time()
+        max_age = self.fresh_ttl + self.stale_ttl if max_age is None else max_age
+        names = ", ".join(f"p.{name}" for name in catalog_columns)
+        with self._lock:
+            row = self._db.execute("SELECT fetched FROM searches WHERE search_key = ?", (search_key,)).fetchone()
+            if row is not None and now - row[0] <= max_age:
+                rows = self._db.execute(f"SELECT {names} FROM search_results r JOIN products p ON p.key = r.key "
+                                        "WHERE r.search_key = ? ORDER BY r.rank", (search_key,)).fetchall()
+                kind, age = "exact", now - row[0]
+            else:
+                match = fts_query(query or "")
+                rows = []
+                if match and fulltext:
+                    rows = self._db.execute(
+                        f"SELECT {names}, p.updated FROM products_fts f JOIN products p ON p.rowid = f.rowid "
+                        "WHERE products_fts MATCH ? AND p.platform = ? AND p.updated >= ? AND p.price <= ? "
+                        "ORDER BY bm25(products_fts)",
+                        (match, platform, now - max_age, float("inf") if max_price is None else float(max_price))).fetchall()
+                if len(rows) < max(1, min_results):
+                    self.counts["misses"] += 1
+                    metrics.inc("catalog_requests_total", platform=platform, result="miss")
+                    return None
+                kind, age = "fulltext", now - min(r[-1] for r in rows)
+                rows = [r[:-1] for r in rows]
+            self.counts[kind] += 1
+        metrics.inc("catalog_requests_total", platform=platform, result=kind)
+        batch = ProductBatch.from_dicts([dict(zip(catalog_columns, r)) for r in rows])
+        return ProductBatch(batch.columns, age), age
+
+    def offline(self, search_key: str, platform: str, query: str, max_price=None, fulltext: bool = True):
+        """
+        Best local answer of any age, for when the platform cannot be reached.
+        """
+        found = self.lookup(search_key, platform, query, max_price, min_results=1, max_age=float("inf"),
+                            fulltext=fulltext)
+        if found is not None:
+            self.counts["offline"] += 1
+        return found
+
+    # SQLite reads block (and wait for the writer's lock), so the event loop hands them to a thread.
+    async def alookup(self, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: self.lookup(*args, **kwargs))
+
+    async def aoffline(self, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: self.offline(*args, **kwargs))
+
+    def price_history(self, platform: str, product_id: str):
+        """
+        [(price, seen timestamp)] for a product, oldest first.
+        """
+        with self._lock:
+            return self._db.execute("SELECT price, seen FROM price_history WHERE key = ? ORDER BY seen",
+                                    (f"{platform}:{product_id}",)).fetchall()
+
+    # Background refresh
+    def refresh(self, search_key: str, fetch):
+        """
+        Re-run a stale search in the background, at batch priority and once at a time per key.
+        fetch() returns the coroutine that fetches and ingests it. Call from the event loop.
+        """
+        with self._lock:
+            if search_key in self.refreshing:
+                return
+            self.refreshing.add(search_key)
+            self.counts["refreshes"] += 1
+
+        async def run():
+            # A fresh context: the refresh is not part of the request that triggered it.
+            current_priority.set("batch")
+            try:
+                await fetch()
+            except Exception as error:
+                logger.warning("Background refresh of %s failed: %r", search_key, error)
+            finally:
+                with self._lock:
+                    self.refreshing.discard(search_key)
+
+        task = contextvars.Context().run(asyncio.get_running_loop().create_task, run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        metrics.inc("catalog_refreshes_total")
+
+    def stats(self):
+        with self._lock:
+            products = self._db.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            searches = self._db.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+        local = self.counts["exact"] + self.counts["fulltext"]
+        total = local + self.counts["misses"]
+        return {"products": products, "searches": searches, **self.counts, "refreshing": len(self.refreshing),
+                "local_rate": round(local / total, 3) if total else 0.0}
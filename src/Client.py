@@ -0,0 +1,182 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import httpx
+
+from src.Metrics import metrics
+from src import Resilience
+
+
+# SHARED EVENT LOOP
+# Streamlit and the Tools class are synchronous, so all platform I/O runs on one
+# long-lived event loop in a daemon thread. Every pooled client is bound to it.
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """
+    Return the background event loop, starting it on first use.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=_loop.run_forever, name="platform-io", daemon=True)
+            thread.start()
+    return _loop
+
+
+def run_sync(coro, timeout=None):
+    """
+    Run a coroutine on the background loop and block until it returns.
+    On timeout the coroutine is cancelled so it stops holding connections.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def retryable_http(error):
+    """
+    Transport errors, 5xx and 429 are transient; other 4xx are not.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, httpx.TransportError)
+
+
+# POOLED HTTP CLIENT
+class PlatformClient:
+    def __init__(self, host: str, headers: dict, max_connections: int = 10, max_keepalive: int = 5,
+                 connect_timeout: float = 3.0, read_timeout: float = 10.0, keepalive_expiry: float = 30.0,
+                 base_url: str = None, resilience=None, limiter=None):
+        """
+        Bounded connection pool for a single RapidAPI host.
+        Connections are shared by every query and page fetched on the background loop.
+        base_url overrides https://<host>, e.g. to point at a local stand-in server.
+        Requests go through the host's circuit breaker, retries and hedging; pass
+        resilience to override the policy configured from the environment.
+        limiter (a RateLimiter) paces requests and tracks the quota from response headers.
+        """
+        self.host = host
+        self.base_url = base_url or f"https://{host}"
+        self.headers = headers
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.resilience = resilience or Resilience.from_env(host, retryable_http, hedge=True)
+        self.limiter = limiter
+        # Created lazily so the client is bound to the background loop.
+        self._client = None
+
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                limits=self.limits,
+                timeout=self.timeout,
+                # Re-dial once when a pooled keep-alive connection turns out to be stale.
+                transport=httpx.AsyncHTTPTransport(limits=self.limits, retries=1),
+            )
+        return self._client
+
+    async def get_json(self, path: str, params: dict = None, deadline=None):
+        """
+        GET the given path and decode the JSON body.
+        Each attempt's timeout is capped by what is left of the deadline.
+        """
+        async def attempt():
+            request_timeout = self.timeout
+            timeout = deadline.timeout() if deadline else None
+            if timeout is not None:
+                request_timeout = httpx.Timeout(min(timeout, self.timeout.read), connect=min(timeout, self.timeout.connect))
+            # Every attempt, retry or hedge spends rate and quota.
+            if self.limiter:
+                await self.limiter.acquire(deadline)
+            with metrics.span("http", host=self.host):
+                try:
+                    response = await self.client().get(path, params=params, timeout=request_timeout)
+                    if self.limiter:
+                        self.limiter.update(response)
+                    response.raise_for_status()
+                except Exception as error:
+                    metrics.inc("upstream_errors_total", host=self.host, error=type(error).__name__)
+                    raise
+                return response.json()
+
+        return await self.resilience.acall(attempt, deadline)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# CONCURRENT PAGINATION
+async def fetch_pages(fetch_page, max_pages: int, enough=None, deadline=None, window: int = 2):
+    """
+    Fetch pages 1..max_pages and return the non-empty ones in page order.
+    Page 1 is fetched alone; later pages are requested only while enough(pages) reports
+    that the pages so far are not sufficient, at most window at a time, so pages that
+    turn out not to be needed are never sent (each one is billed).
+    Pagination stops at the first empty page, and when the deadline passes.
+    Only a failure on the first page is raised; later failures end pagination there.
+    """
+    tasks = {}
+    pending = set()
+    pages = {}
+    last_page = max_pages
+    next_page = 1
+
+    def launch():
+        nonlocal next_page
+        task = asyncio.ensure_future(fetch_page(next_page))
+        tasks[task] = next_page
+        pending.add(task)
+        next_page += 1
+
+    launch()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=deadline.remaining() if deadline else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                page = tasks[task]
+                if task.exception() is not None and page == 1:
+                    raise task.exception()
+                items = task.result() if task.exception() is None else None
+                if items is None or len(items) == 0:
+                    last_page = min(last_page, page - 1)
+                else:
+                    pages[page] = items
+
+            # Pages past the end of the results are no longer needed.
+            for task in [t for t in pending if tasks[t] > last_page]:
+                task.cancel()
+                pending.discard(task)
+
+            fetched = [pages[page] for page in sorted(pages) if page <= last_page]
+            if enough is not None and enough(fetched):
+                break
+            if deadline is not None and deadline.expired():
+                # Out of budget: keep what has arrived.
+                break
+            while next_page <= last_page and len(pending) < window:
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+        # Mark failures of pages that are no longer needed as seen.
+        for task in tasks:
+            if task.done() and not task.cancelled():
+                task.exception()
+
+    return [pages[page] for page in sorted(pages) if page <= last_page]
@@ -0,0 +1,41 @@
+import time
+
+
+# REQUEST DEADLINE
+class Deadline:
+    def __init__(self, budget: float = None, expires: float = None):
+        """
+        Latency budget for one request, passed down to every stage that can block.
+        A budget of None never expires.
+        """
+        if expires is None and budget is not None:
+            expires = time.monotonic() + budget
+        self.expires = expires
+
+    def remaining(self):
+        """
+        Seconds left, or None when unbounded.
+        """
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+
+    def timeout(self, cap: float = None):
+        """
+        Timeout for one blocking call: the time left, but never more than cap.
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        return remaining if cap is None else min(cap, remaining)
+
+    def reserve(self, seconds: float):
+        """
+        Deadline that ends `seconds` earlier, keeping time for the stages that follow.
+        """
+        if self.expires is None:
+            return self
+        return Deadline(expires=max(time.monotonic(), self.expires - seconds))
@@ -0,0 +1,116 @@
+import calendar
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import re
+
+import numpy as np
+import pytz
+
+# Timezone the delivery texts and shipping deadlines are read in.
+local_tz = pytz.timezone('Asia/Kolkata')
+
+months = {name[:3].lower(): index for index, name in enumerate(calendar.month_name) if name}
+weekdays = {name[:3].lower(): index for index, name in enumerate(calendar.day_name)}
+
+month_pattern = r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+(\d{1,2})\b"
+weekday_prefix = r"(?:(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?,?\s+)?"
+# "Oct 25", "Oct 25 - 28", "Oct 30 - Nov 2" and "Sat, Oct 24 - Mon, Oct 26"; a range counts as its last day.
+month_range_re = re.compile(month_pattern + r"(?:\s*[-–]\s*" + weekday_prefix +
+                            r"(?:(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+)?(\d{1,2})\b)?")
+# ISO dates and M/D/Y anywhere; a bare M/D only right after a delivery word ("arrives by 10/25"),
+# so fractions such as "1/2 price" are not read as dates.
+numeric_re = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b|\b(\d{1,2})/(\d{1,2})/(\d{2,4})\b"
+                        r"|\b(?:deliver[a-z]*|arriv[a-z]*|by|get it|ships?)\W+" + weekday_prefix + r"(\d{1,2})/(\d{1,2})\b")
+days_re = re.compile(r"\bin\s+(\d+)(?:\s*[-–]\s*(\d+))?\s+(?:business\s+)?days?\b")
+weekday_re = re.compile(r"\b(" + "|".join(name.lower() for name in calendar.day_name) + r"|mon|tue|wed|thu|fri|sat|sun)\b")
+
+
+def local_today():
+    """
+    Today's date in local_tz.
+    """
+    return datetime.now(local_tz).date()
+
+
+def month_day(month: int, day: int, today: date):
+    """
+    Next occurrence of month/day, allowing dates up to a week in the past (e.g. "delivered Oct 1").
+    """
+    try:
+        found = date(today.year, month, day)
+        if found < today - timedelta(days=7):
+            found = date(today.year + 1, month, day)
+    except ValueError:
+        return None
+    return found
+
+
+@lru_cache(maxsize=16384)
+def parse_delivery(text: str, today: date):
+    """
+    Delivery date in an Amazon "delivery" or Walmart slaText string, or None.
+    Reads "Fri, Oct 25", "Oct 25 - 28", "by 10/25", "2026-10-25", "today", "tomorrow",
+    "in 3-5 days" and bare weekdays. When the text offers several dates (e.g. standard and
+    fastest delivery) the earliest is used; ranges count as their last day.
+    Memoized on (text, today): the same strings repeat across products and pages.
+    """
+    if not text:
+        return None
+    text = text.lower()
+    found = []
+    for match in month_range_re.finditer(text):
+        month, day, end_month, end_day = match.groups()
+        if end_day:
+            found.append(month_day(months[(end_month or month)[:3]], int(end_day), today))
+        else:
+            found.append(month_day(months[month], int(day), today))
+    for match in numeric_re.finditer(text):
+        year, month, day, us_month, us_day, us_year, bare_month, bare_day = match.groups()
+        try:
+            if year:
+                found.append(date(int(year), int(month), int(day)))
+            elif us_year:
+                found.append(date(int(us_year) % 100 + 2000, int(us_month), int(us_day)))
+            else:
+                found.append(month_day(int(bare_month), int(bare_day), today))
+        except ValueError:
+            pass
+    for match in days_re.finditer(text):
+        found.append(today + timedelta(days=int(match.group(2) or match.group(1))))
+    if re.search(r"\btoday\b", text):
+        found.append(today)
+    if re.search(r"\btomorrow\b", text):
+        found.append(today + timedelta(days=1))
+    found = [d for d in found if d is not None]
+    if not found:
+        # Only a weekday ("Arrives Friday"): its next occurrence, today included.
+        match = weekday_re.search(text)
+        if match is None:
+            return None
+        found.append(today + timedelta(days=(weekdays[match.group(1)[:3]] - today.weekday()) % 7))
+    return min(found)
+
+
+def delivery_dates(texts: list, today: date = None):
+    """
+    Typed delivery_date column (datetime64[m], NaT when unknown) for a column of delivery texts.
+    The clock is read once for the whole column.
+    """
+    today = today or local_today()
+    parsed = [parse_delivery(text, today) if isinstance(text, str) else None for text in texts]
+    return np.array([d if d is not None else "NaT" for d in parsed], dtype="datetime64[D]").astype("datetime64[m]")
+
+
+def deadline_date(day: str, today: date = None):
+    """
+    Shipping deadline as a datetime64[m], or None if the text names no date.
+    A weekday means its next occurrence after today, as in "arrive by Friday";
+    anything parse_delivery reads (e.g. "Oct 25", "tomorrow") also works.
+    """
+    today = today or local_today()
+    day = str(day).strip().lower()
+    if weekday_re.fullmatch(day):
+        days_until = (weekdays[day[:3]] - today.weekday()) % 7 or 7
+        return np.datetime64(today + timedelta(days=days_until), 'm')
+    found = parse_delivery(day, today)
+    return np.datetime64(found, 'm') if found is not None else None
@@ -0,0 +1,323 @@
+import concurrent.futures
+from functools import lru_cache
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from src.Metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Words that say nothing about which product it is.
+stopwords = frozenset("a an and the for with of in on by to from new free best sale item items product".split())
+# Units folded to one spelling so "16 fl oz" and "16oz" compare equal.
+unit_aliases = {"fl oz": "oz", "ounce": "oz", "ounces": "oz", "lbs": "lb", "pound": "lb", "pounds": "lb",
+                "liter": "l", "litre": "l", "liters": "l", "inch": "in", "inches": "in", '"': "in",
+                "pk": "pack", "count": "pack", "ct": "pack", "pcs": "pack", "piece": "pack", "pieces": "pack"}
+size_pattern = re.compile(r"(\d+(?:\.\d+)?)\s*(fl oz|oz|ounces?|lbs?|pounds?|kg|g|ml|l|liters?|litres?|gb|tb|mb|"
+                          r"mah|w|mm|cm|inch(?:es)?|in|\"|ft|pack|pk|count|ct|pcs|pieces?)\b", re.I)
+shoe_size_pattern = re.compile(r"\bsize\s*:?\s*([\w.]+)", re.I)
+
+mersenne_prime = (1 << 61) - 1
+
+
+@lru_cache(maxsize=65536)
+def parse_title(title: str):
+    """
+    Normalized tokens, brand guess and sizes of a product title.
+    Sizes ("16oz", "size:10") are kept out of the tokens and compared on their own.
+    """
+    text = title.lower()
+    sizes = set()
+    for number, unit in size_pattern.findall(text):
+        unit = unit_aliases.get(unit, unit)
+        sizes.add(f"{float(number):g}{unit}")
+    sizes.update(f"size:{size}" for size in shoe_size_pattern.findall(text))
+    text = shoe_size_pattern.sub(" ", size_pattern.sub(" ", text))
+    # Keep alphanumerics; "men's" -> "mens", "t-shirt" -> "tshirt".
+    text = re.sub(r"(?<=\w)['’-](?=\w)", "", text)
+    words = [word for word in re.split(r"[^a-z0-9]+", text) if word and word not in stopwords]
+    brand = next((word for word in words if word.isalpha()), None)
+    return frozenset(words), brand, frozenset(sizes)
+
+
+def product_key(product: dict):
+    return f"{product['platform']}:{product.get('product_id') or product.get('product_url')}"
+
+
+def size_unit(size: str):
+    return size.split(":")[0] if ":" in size else re.sub(r"^[\d.]+", "", size)
+
+
+def sizes_conflict(a: frozenset, b: frozenset):
+    """
+    True when both titles give a size in the same unit and no such size agrees.
+    """
+    for unit in {size_unit(size) for size in a}:
+        mine = {size for size in a if size_unit(size) == unit}
+        theirs = {size for size in b if size_unit(size) == unit}
+        if theirs and not mine & theirs:
+            return True
+    return False
+
+
+# MINHASH LSH
+class MinHashLSH:
+    def __init__(self, num_perm: int = 96, bands: int = 24, seed: int = 1):
+        """
+        MinHash signatures over title tokens, banded into buckets: two titles share a bucket
+        with high probability when their token Jaccard similarity is above ~(1/bands)**(1/rows).
+        The permutations are seeded so signatures stay valid across restarts.
+        """
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self.buckets = {}
+
+    def signature(self, tokens):
+        if not tokens:
+            return np.full(self.num_perm, mersenne_prime, dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens), dtype=np.uint64, count=len(tokens))
+        return ((hashes[:, None] * self.a + self.b) % mersenne_prime).min(axis=0)
+
+    def band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def insert(self, key: str, signature):
+        for band_key in self.band_keys(signature):
+            self.buckets.setdefault(band_key, set()).add(key)
+
+    def query(self, signature):
+        candidates = set()
+        for band_key in self.band_keys(signature):
+            candidates.update(self.buckets.get(band_key, ()))
+        return candidates
+
+
+# MATCH INDEX
+class MatchIndex:
+    platforms = ("amazon", "walmart")
+
+    def __init__(self, path: str = None, threshold: float = 0.5, max_postings: int = 50):
+        """
+        Links the same product across platforms (Amazon ASIN <-> Walmart item).
+        Candidates come from MinHash LSH buckets plus an inverted index on each title's rarest
+        tokens, restricted to the other platform, so no title is compared pairwise with every
+        other. A candidate is accepted when its token Jaccard similarity reaches `threshold`,
+        sizes in the same unit agree and, if they differ, the brands only halve the score.
+        Products and matches are kept in SQLite at `path` (in memory when None) and reloaded on start.
+        Indexing runs on one background thread, off the search's request path. Each process
+        keeps its own copy in memory, so with several server workers a link made by one
+        worker is only seen by the others after they restart.
+        """
+        self.threshold = threshold
+        self.max_postings = max_postings
+        self.lsh = MinHashLSH()
+        self.entries = {}
+        self.postings = {}
+        self.best = {}
+        self.added = 0
+        self.matched = 0
+        self.compared = 0
+        self._lock = threading.Lock()
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="match-index")
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, timeout=10)
+        if path:
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS products ("
+                         "key TEXT PRIMARY KEY, platform TEXT, name TEXT, price REAL, product_url TEXT, "
+                         "signature BLOB, updated REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS matches ("
+                         "amazon TEXT, walmart TEXT, score REAL, updated REAL, PRIMARY KEY (amazon, walmart))")
+        self._db.execute("CREATE INDEX IF NOT EXISTS matches_walmart ON matches (walmart)")
+        self._db.commit()
+        self.load()
+
+    def load(self):
+        for key, platform, name, price, url, signature in self._db.execute(
+                "SELECT key, platform, name, price, product_url, signature FROM products"):
+            self.index(key, platform, name, price, url, np.frombuffer(signature, dtype=np.uint64))
+        for amazon, walmart, score in self._db.execute("SELECT amazon, walmart, score FROM matches"):
+            self.link(amazon, walmart, score)
+        if self.entries:
+            logger.info("Match index loaded %d products, %d matches", len(self.entries), len(self.best) // 2)
+
+    def index(self, key, platform, name, price, url, signature):
+        tokens, brand, sizes = parse_title(name)
+        self.entries[key] = {"platform": platform, "name": name, "price": price, "product_url": url,
+                             "tokens": tokens, "brand": brand, "sizes": sizes}
+        self.lsh.insert(key, signature)
+        for token in tokens:
+            self.postings.setdefault((platform, token), set()).add(key)
+
+    def link(self, a, b, score):
+        self.best[a] = (b, score)
+        self.best[b] = (a, score)
+
+    def add(self, products):
+        """
+        Queue formatted products (dicts or a ProductBatch) for indexing on the writer thread.
+        Failures are logged, never raised to the search that found the products.
+        """
+        future = self.writer.submit(self._add_logged, products)
+        return future
+
+    def flush(self, timeout: float = 1.0):
+        """
+        Wait up to timeout seconds for the products queued so far to be indexed.
+        """
+        try:
+            self.writer.submit(lambda: None).result(timeout)
+        except concurrent.futures.TimeoutError:
+            logger.warning("Match index is still indexing; comparing with what is indexed")
+
+    def _add_logged(self, products):
+        try:
+            self._add(products)
+        except Exception as error:
+            logger.error("Match indexing failed: %r", error)
+            metrics.inc("match_index_errors_total")
+
+    def _add(self, products):
+        """
+        Index formatted products and match the new ones. Known products only get their price refreshed.
+        """
+        if hasattr(products, "to_dicts"):
+            products = products.to_dicts()
+        now = time.time()
+        rows, links = [], []
+        with self._lock, metrics.span("match_index") as span:
+            fresh = []
+            for product in products:
+                if not product.get("name") or product.get("platform") not in self.platforms:
+                    continue
+                key = product_key(product)
+                entry = self.entries.get(key)
+                price = product.get("price")
+                price = float(price) if isinstance(price, (int, float)) and price == price else None
+                if entry is not None and entry["name"] == product["name"]:
+                    entry["price"] = price if price is not None else entry["price"]
+                    rows.append((key, product["platform"], product["name"], entry["price"],
+                                 product.get("product_url"), None, now))
+                    continue
+                signature = self.lsh.signature(parse_title(product["name"])[0])
+                self.index(key, product["platform"], product["name"], price, product.get("product_url"), signature)
+                rows.append((key, product["platform"], product["name"], price, product.get("product_url"),
+                             signature.tobytes(), now))
+                fresh.append((key, signature))
+
+            for key, signature in fresh:
+                match = self.find(key, signature)
+                if match is None:
+                    continue
+                other, score = match
+                # Keep the better link when either side was already matched.
+                if score > self.best.get(other, (None, -1.0))[1] and score > self.best.get(key, (None, -1.0))[1]:
+                    for stale in (self.best.get(key, (None,))[0], self.best.get(other, (None,))[0]):
+                        self.best.pop(stale, None)
+                    self.link(key, other, score)
+                    amazon, walmart = (key, other) if self.entries[key]["platform"] == "amazon" else (other, key)
+                    links.append((amazon, walmart, score, now))
+            self.added += len(fresh)
+            self.matched += len(links)
+            span.set(products_in=len(products), new=len(fresh), matched=len(links))
+
+            # Known products keep their stored signature.
+            self._db.executemany("INSERT INTO products (key, platform, name, price, product_url, signature, updated) "
+                                 "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                                 "name = excluded.name, price = excluded.price, product_url = excluded.product_url, "
+                                 "signature = COALESCE(excluded.signature, products.signature), updated = excluded.updated",
+                                 rows)
+            for amazon, walmart, score, updated in links:
+                self._db.execute("DELETE FROM matches WHERE amazon = ? OR walmart = ?", (amazon, walmart))
+            self._db.executemany("INSERT OR REPLACE INTO matches (amazon, walmart, score, updated) VALUES (?, ?, ?, ?)",
+                                 links)
+            self._db.commit()
+        metrics.inc("match_links_total", len(links))
+
+    def candidates(self, key, signature):
+        """
+        Other-platform products sharing an LSH bucket or one of the title's rarest tokens.
+        """
+        entry = self.entries[key]
+        other = "walmart" if entry["platform"] == "amazon" else "amazon"
+        found = {candidate for candidate in self.lsh.query(signature) if self.entries[candidate]["platform"] == other}
+        postings = sorted((self.postings.get((other, token), ()) for token in entry["tokens"]), key=len)
+        for posting in [p for p in postings if p][:2]:
+            if len(posting) <= self.max_postings:
+                found.update(posting)
+        return found
+
+    def find(self, key, signature):
+        """
+        Best other-platform match for an indexed product as (key, score), or None.
+        """
+        entry = self.entries[key]
+        best = None
+        for candidate in self.candidates(key, signature):
+            other = self.entries[candidate]
+            self.compared += 1
+            if sizes_conflict(entry["sizes"], other["sizes"]):
+                continue
+            union = len(entry["tokens"] | other["tokens"])
+            score = len(entry["tokens"] & other["tokens"]) / union if union else 0.0
+            if entry["brand"] and other["brand"] and entry["brand"] != other["brand"]:
+                score /= 2
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (candidate, round(score, 3))
+        return best
+
+    def match(self, product: dict):
+        """
+        The indexed counterpart of a product on the other platform as a dict with its score, or None.
+        """
+        with self._lock:
+            link = self.best.get(product_key(product))
+            if link is None:
+                return None
+            other, score = link
+            return {**{k: v for k, v in self.entries[other].items() if k in ("platform", "name", "price", "product_url")},
+                    "key": other, "score": score}
+
+    def compare(self, results: dict, deadline=None):
+        """
+        Price comparison over matched pairs: for every product in results with a known
+        counterpart, both prices and the saving. Prices from results win over stored ones.
+        Sorted by saving, largest first.
+        """
+        # Products from the search being compared may still be queued for indexing;
+        # wait for them only while the deadline allows.
+        self.flush(deadline.timeout(1.0) if deadline else 1.0)
+        current = {product_key(product): product for result in results.values() for product in result.get("products", [])}
+        pairs, seen = [], set()
+        for key, product in current.items():
+            counterpart = self.match(product)
+            if counterpart is None or key in seen:
+                continue
+            seen.update((key, counterpart["key"]))
+            other = current.get(counterpart["key"], counterpart)
+            sides = {product["platform"]: product, other["platform"]: other}
+            if len(sides) != 2 or any(not isinstance(side.get("price"), (int, float)) for side in sides.values()):
+                continue
+            cheaper = min(sides, key=lambda platform: sides[platform]["price"])
+            pairs.append({
+                "name": sides["amazon"]["name"],
+                "amazon_price": sides["amazon"]["price"], "walmart_price": sides["walmart"]["price"],
+                "amazon_url": sides["amazon"].get("product_url"), "walmart_url": sides["walmart"].get("product_url"),
+                "cheaper": cheaper, "saving": round(abs(sides["amazon"]["price"] - sides["walmart"]["price"]), 2),
+                "score": counterpart["score"],
+            })
+        return sorted(pairs, key=lambda pair: -pair["saving"])
+
+    def stats(self):
+        return {"products": len(self.entries), "matches": len(self.best) // 2, "added": self.added,
+                "linked": self.matched, "comparisons": self.compared,
+                "comparisons_per_product": round(self.compared / self.added, 2) if self.added else 0.0}
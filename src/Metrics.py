@@ -0,0 +1,156 @@
+import asyncio
+from collections import deque
+import contextvars
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a slow upstream.
+default_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# (trace_id, span_id) of the span currently open in this context.
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def label_key(labels: dict):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+
+# SPAN
+class Span:
+    def __init__(self, registry, name: str, labels: dict):
+        """
+        Timed unit of work. Records its duration in the stage_duration_seconds
+        histogram and keeps W3C-style trace context for nested spans.
+        """
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.attributes = {}
+        parent = current_span.get()
+        self.trace_id = parent[0] if parent else os.urandom(16).hex()
+        self.parent_id = parent[1] if parent else None
+        self.span_id = os.urandom(8).hex()
+        self.error = None
+
+    def __enter__(self):
+        self._token = current_span.set((self.trace_id, self.span_id))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        current_span.reset(self._token)
+        labels = {"stage": self.name, **self.labels}
+        self.registry.observe("stage_duration_seconds", self.duration, **labels)
+        # Cancelled work (e.g. pages no longer needed) and a consumer closing a
+        # streaming generator early are not errors.
+        if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+            self.registry.inc("stage_cancelled_total", **labels)
+        elif exc is not None:
+            self.error = repr(exc)
+            self.registry.inc("stage_errors_total", **labels)
+        self.registry.finish(self)
+        return False
+
+    def set(self, **attributes):
+        """
+        Attach attributes; products_in / products_out are also counted per stage.
+        """
+        self.attributes.update(attributes)
+        for key in ("products_in", "products_out"):
+            if key in attributes:
+                self.registry.inc(f"stage_{key}_total", attributes[key], stage=self.name, **self.labels)
+
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+# REGISTRY
+class Metrics:
+    def __init__(self, max_spans: int = 1000):
+        """
+        In-process counters, gauges and fixed-bucket histograms with a Prometheus text export,
+        plus a ring buffer of recently finished spans.
+        """
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.spans = deque(maxlen=max_spans)
+
+    def span(self, name: str, **labels):
+        return Span(self, name, labels)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(default_buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(default_buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+                    break
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def finish(self, span: Span):
+        record = {"trace_id": span.trace_id, "span_id": span.span_id, "parent_id": span.parent_id,
+                  "name": span.name, "labels": span.labels, "duration": round(span.duration, 6),
+                  "attributes": span.attributes, "error": span.error}
+        self.spans.append(record)
+        logger.debug("span %s", record)
+
+    def recent_spans(self, trace_id: str = None):
+        return [s for s in list(self.spans) if trace_id is None or s["trace_id"] == trace_id]
+
+    def export_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                seen = set()
+                for (name, key), value in sorted(metrics.items()):
+                    if name not in seen:
+                        lines.append(f"# TYPE {name} {kind}")
+                        seen.add(name)
+                    lines.append(f"{name}{format_labels(key)} {value}")
+            seen = set()
+            for (name, key), histogram in sorted(self.histograms.items()):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} histogram")
+                    seen.add(name)
+                cumulative = 0
+                for bound, count in zip(default_buckets, histogram["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(key + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(key + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{name}_sum{format_labels(key)} {round(histogram['sum'], 6)}")
+                lines.append(f"{name}_count{format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry used by every module.
+metrics = Metrics()
+
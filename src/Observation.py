@@ -0,0 +1,68 @@
+import statistics
+
+
+def count_tokens(text):
+    """
+    Rough token estimate (~4 characters per token) for budgeting prompts.
+    """
+    return len(text) // 4 + 1
+
+
+# Columns sent to the summary call; URLs and image links never are.
+observation_fields = ("name", "price", "discount_price", "ratings", "delivery_info", "return_policy")
+
+
+def encode_platform(platform, result, top_k, name_len):
+    """
+    Columnar summary of one platform: counts, price spread, then a table of the
+    top_k cheapest products. Columns holding the same value in every row are
+    moved to a single 'common' line.
+    """
+    products = result.get("products", [])
+    prices = [p["price"] for p in products if isinstance(p.get("price"), (int, float))]
+    header = f"{platform}: {len(products)} products"
+    if prices:
+        header += f" | price min {min(prices)} median {round(statistics.median(prices), 2)} max {max(prices)}"
+    flags = [f"{k}={v}" for k, v in result.items() if k not in ("products", "min_price", "max_price")]
+    if flags:
+        header += " | " + " ".join(flags)
+    lines = [header]
+
+    rows = sorted(products, key=lambda p: p.get("price") or 0)[:top_k]
+    if not rows:
+        return lines
+
+    columns = [f for f in observation_fields if any(f in row for row in rows)]
+    values = {f: [str(row.get(f, ""))[:name_len] if f == "name" else str(row.get(f, "")) for row in rows]
+              for f in columns}
+    common = [f for f in columns if len(rows) > 1 and len(set(values[f])) == 1]
+    if common:
+        lines.append("common: " + " ".join(f"{f}={values[f][0]}" for f in common))
+    table = [f for f in columns if f not in common]
+    lines.append("|".join(table))
+    lines.extend("|".join(values[f][i] for f in table) for i in range(len(rows)))
+    return lines
+
+
+def encode_observation(searched_products: dict, token_budget: int = 400, top_k: int = 5, name_len: int = 60):
+    """
+    Encode the tool results compactly for the summary prompt, shrinking top_k and
+    then product names until the text fits token_budget.
+    Returns the encoded text and a report of the tokens saved against the raw dump.
+    """
+    while True:
+        lines = []
+        for platform, result in searched_products.items():
+            lines.extend(encode_platform(platform, result, top_k, name_len))
+        text = "\n".join(lines)
+        tokens = count_tokens(text)
+        if tokens <= token_budget or (top_k <= 1 and name_len <= 20):
+            break
+        if top_k > 1:
+            top_k -= 1
+        else:
+            name_len = max(20, name_len // 2)
+
+    raw_tokens = count_tokens(format(searched_products))
+    report = {"tokens": tokens, "raw_tokens": raw_tokens, "saved_tokens": max(0, raw_tokens - tokens), "top_k": top_k}
+    return text, report
@@ -0,0 +1,221 @@
+import concurrent.futures
+import contextvars
+import logging
+
+import numpy as np
+
+from src.Deadline import Deadline
+from src.Delivery import deadline_date
+from src.Metrics import metrics
+from src.Product import ProductBatch
+
+logger = logging.getLogger(__name__)
+
+
+# REQUEST CONTEXT
+class RequestContext:
+    def __init__(self, params: dict, tools: dict, platforms: dict, deadline: Deadline = None, prefetched: dict = None):
+        """
+        Everything that belongs to one query: its params, selected tools, the
+        (stateless, shared) platform adapters to run, its deadline and the results so far.
+        prefetched maps a platform to a speculative search already running for these params.
+        """
+        self.params = dict(params)
+        self.tools = dict(tools)
+        self.platforms = platforms
+        self.deadline = deadline or Deadline()
+        self.prefetched = prefetched or {}
+        self.results = {platform: {'products': []} for platform in platforms}
+
+
+# FUSED FILTER PIPELINE
+class Pipeline:
+    def __init__(self, search_fn, max_workers: int = 8):
+        """
+        Run the selected tools as one fused pass per platform on a long-lived pool.
+        search_fn(platform_obj, platform, params, deadline, prefetched) returns the platform's formatted products.
+        """
+        self.search_fn = search_fn
+        # Shared by every request so no executor is created per tool or per query.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix="pipeline")
+
+    def compile(self, params: dict, tools: dict):
+        """
+        Turn the selected filter tools into vectorized stages over a ProductBatch:
+          annotations  stage(platform_obj, batch) -> batch, add the columns predicates need
+          predicates   stage(batch) -> mask, AND-ed together and applied in one filter
+          transforms   stage(platform_obj, batch) -> batch, run only on the survivors
+        """
+        annotations, predicates, transforms = [], [], []
+        if tools.get('price_filter'):
+            max_price = float(params.get('max_price', float('inf')))
+            predicates.append(('price_filter', lambda batch: batch.price_mask(max_price)))
+
+        if tools.get('check_shipping_time'):
+            # delivery_date is parsed at ingest; the deadline is computed once per request.
+            deadline = deadline_date(params.get('deadline', ''))
+            if deadline is None:
+                logger.warning("Ignoring unreadable shipping deadline %r", params.get('deadline'))
+            else:
+                predicates.append(('check_shipping_time', lambda batch: batch.shipping_mask(deadline)))
+
+        if tools.get('check_return_policy'):
+            annotations.append(('check_return_policy', lambda platform_obj, batch: platform_obj.return_policy(batch)))
+            predicates.append(('check_return_policy', lambda batch: batch.valid_mask(["return_policy"])))
+
+        if tools.get('check_discount'):
+            transforms.append(('check_discount', lambda platform_obj, batch: platform_obj.discount_check(batch)))
+
+        return annotations, predicates, transforms
+
+    def run_platform(self, context: RequestContext, platform: str, stages: tuple):
+        """
+        Search one platform and push its batch through all stages in a single pass.
+        """
+        annotations, predicates, transforms = stages
+        platform_obj, params, tools = context.platforms[platform], context.params, context.tools
+        result = {}
+        batch = ProductBatch.from_dicts([])
+        if tools.get('search_products') or tools.get('price_comparison'):
+            batch = self.search_fn(platform_obj, platform, params, context.deadline, context.prefetched.get(platform))
+            logger.info("%d Products fetched from the %s", len(batch), platform)
+            # Pagination stopped at the deadline, so there may have been more products.
+            if context.deadline.expired():
+                result['partial'] = True
+            # Answered from the catalog: say so, and how old the products are.
+            if batch.age is not None:
+                result['stale'] = True
+                result['age_s'] = round(batch.age)
+
+        for name, stage in annotations:
+            with metrics.span(name, platform=platform):
+                batch = stage(platform_obj, batch)
+        if predicates:
+            mask = np.ones(len(batch), dtype=bool)
+            for name, predicate in predicates:
+                with metrics.span(name, platform=platform) as span:
+                    keep = predicate(batch)
+                    span.set(products_in=len(batch), products_out=int(keep.sum()))
+                mask &= keep
+            batch = batch.filter(mask)
+        for name, stage in transforms:
+            with metrics.span(name, platform=platform) as span:
+                batch = stage(platform_obj, batch)
+                span.set(products_in=len(batch), products_out=len(batch))
+
+        if tools.get('check_discount'):
+            result['discount_validity'] = True
+        if tools.get('check_return_policy'):
+            result['return_policy'] = True
+        if tools.get('price_comparison'):
+            batch = batch.sort_by("price")
+            result['min_price'] = float(batch['price'][0]) if len(batch) else None  # Min Price
+            result['max_price'] = float(batch['price'][-1]) if len(batch) else None  # Max Price
+
+        # Back to the dict format at the edge.
+        result['products'] = batch.to_dicts()
+        return result
+
+    def submit(self, context: RequestContext):
+        """
+        Start the fused pass for every platform of the request and return {platform: future}.
+        Each platform filters as soon as its own search returns.
+        """
+        stages = self.compile(context.params, context.tools)
+        # Each task runs in a copy of the caller's context so its spans join the request trace.
+        return {
+            platform: self.executor.submit(contextvars.copy_context().run,
+                                           self.run_platform, context, platform, stages)
+            for platform in context.platforms
+        }
+
+    def stream(self, context: RequestContext):
+        """
+        Yield (platform, result) as soon as each platform's fused pass finishes,
+        recording it in context.results. Platforms still running at the deadline are
+        yielded empty and flagged partial; their searches time out on their own.
+        """
+        for _, platform, result in self.stream_many([context]):
+            yield platform, result
+
+    def stream_many(self, contexts: list):
+        """
+        stream() for several independent requests at once, e.g. the parallel tool calls of
+        one planning step. Yields (context, platform, result) in completion order.
+        """
+        platform_of = {}
+        for context in contexts:
+            for platform, future in self.submit(context).items():
+                platform_of[future] = (context, platform)
+        pending = set(platform_of)
+        remaining = [context.deadline.remaining() for context in contexts]
+        timeout = None if None in remaining else max(remaining, default=None)
+        try:
+            for future in concurrent.futures.as_completed(platform_of, timeout=timeout):
+                pending.discard(future)
+                context, platform = platform_of[future]
+                try:
+                    context.results[platform] = future.result()
+                except Exception as e:
+                    logger.error("Error while running tools on %s: %r", platform, e)
+                    context.results[platform] = {'products': [], 'error': repr(e)}
+                    if context.deadline.expired():
+                        context.results[platform]['partial'] = True
+                yield context, platform, context.results[platform]
+        except concurrent.futures.TimeoutError:
+            for future in pending:
+                context, platform = platform_of[future]
+                logger.warning("%s missed the deadline, returning partial results", platform)
+                future.cancel()
+                context.results[platform] = {'products': [], 'partial': True}
+                yield context, platform, context.results[platform]
+        for context in contexts:
+            for platform, result in context.results.items():
+                if result.get('partial'):
+                    metrics.inc("partial_results_total", platform=platform)
+
+    def run(self, context: RequestContext):
+        """
+        Run the pipeline and wait for every platform.
+        """
+        for _ in self.stream(context):
+            pass
+        return context.results
+
+
+# RESULT AGGREGATION
+def aggregate_products(results: dict, per_platform: int = 25):
+    """
+    Merge the top products of every platform into one list sorted by price.
+    """
+    aggregated = []
+    for platform in results:
+        aggregated.extend(results[platform].get('products', [])[:per_platform])
+    return sorted(aggregated, key=lambda product: product['price'])
+
+
+def merge_results(results: dict, platform: str, result: dict):
+    """
+    Fold one platform result into results, e.g. from several searches on the same platform.
+    Products are de-duplicated by product_id, flags are OR-ed, price ranges widened and
+    the oldest age_s kept.
+    Returns the merged result for the platform.
+    """
+    merged = results.get(platform)
+    if merged is None:
+        merged = results[platform] = {**result, 'products': list(result.get('products', []))}
+        return merged
+    seen = {product.get('product_id') for product in merged['products']}
+    merged['products'].extend(product for product in result.get('products', [])
+                              if not product.get('product_id') or product['product_id'] not in seen)
+    for key, value in result.items():
+        if key == 'products' or value is None:
+            continue
+        if key in ('min_price', 'max_price', 'age_s') and merged.get(key) is not None:
+            merged[key] = min(merged[key], value) if key == 'min_price' else max(merged[key], value)
+        elif merged.get(key) is None or value is True:
+            merged[key] = value
+    if 'min_price' in merged:
+        merged['products'].sort(key=lambda product: product['price'])
+    return merged
@@ -0,0 +1,299 @@
+import asyncio
+from collections import OrderedDict
+import concurrent.futures
+import json
+import logging
+import re
+import threading
+
+from src.Cache import canonical_params, normalize_query
+from src.Client import get_loop
+from src.Metrics import metrics
+from src.template import all_tools
+
+logger = logging.getLogger(__name__)
+
+
+def batch_prompt(questions: list):
+    """
+    One planning prompt for several independent questions, one numbered section each.
+    """
+    sections = "\n\n".join(f"### {i}\n- **Question:** {question}" for i, question in enumerate(questions, 1))
+    return ("Plan each of the following questions independently. For every question reply with its "
+            "`### <number>` header followed by the Thought and Action lines for that question only.\n\n"
+            + sections)
+
+
+def split_replies(content: str, count: int):
+    """
+    Split a batched reply back into {index: reply}. Sections without an Action line are left out
+    so the caller can plan them on their own.
+    """
+    parts = re.split(r"^\s*#{2,}\s*(\d+)\s*$", content, flags=re.M)
+    replies = {}
+    for number, reply in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and "**Action:**" in reply:
+            replies[index] = reply.strip()
+    return replies
+
+
+def latest(deadlines: list):
+    """
+    The deadline that ends last, so one call can answer every caller; None if any is unbounded.
+    """
+    if any(deadline is None or deadline.expires is None for deadline in deadlines):
+        return None
+    return max(deadlines, key=lambda deadline: deadline.expires)
+
+
+# MICRO-BATCHING PLANNER
+class PlanBatcher:
+    def __init__(self, complete, window: float = 0.02, max_batch: int = 8):
+        """
+        Collect the planning requests that arrive within `window` seconds and answer them
+        with as few LLM calls as possible: identical (normalized) questions share one plan,
+        and distinct questions are planned together in one batched prompt.
+        complete(prompt, deadline) sends a single stateless planning prompt and returns the reply.
+        """
+        self.complete = complete
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._timer = None
+        # Questions whose batched section was missing are re-planned on their own, in parallel.
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_batch, thread_name_prefix="planner")
+        self.questions = 0
+        self.shared = 0
+        self.batched = 0
+        self.llm_calls = 0
+
+    def plan(self, question: str, deadline=None):
+        """
+        Block until the batch holding this question is planned and return its reply.
+        Raises TimeoutError once the deadline passes, however long the batch takes.
+        """
+        key = normalize_query(question)
+        with self._lock:
+            self.questions += 1
+            entry = self._pending.get(key)
+            if entry is not None:
+                self.shared += 1
+                future = entry[1]
+                self._pending[key] = (entry[0], future, latest([entry[2], deadline]))
+            else:
+                future = concurrent.futures.Future()
+                self._pending[key] = (question, future, deadline)
+                if len(self._pending) >= self.max_batch:
+                    # Planned off this thread, so a later deadline in the batch cannot hold it up.
+                    self.executor.submit(self._run, self._take())
+                elif self._timer is None:
+                    self._timer = threading.Timer(self.window, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+        return future.result(timeout=deadline.timeout() if deadline else None)
+
+    def _take(self):
+        batch = list(self._pending.values())
+        self._pending.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _call(self, prompt: str, deadline=None):
+        with self._lock:
+            self.llm_calls += 1
+        return self.complete(prompt, deadline)
+
+    def _run(self, batch: list):
+        with metrics.span("plan_batch") as span:
+            span.set(questions=len(batch))
+            replies = {}
+            if len(batch) > 1:
+                try:
+                    replies = split_replies(self._call(batch_prompt([q for q, _, _ in batch]),
+                                                       latest([d for _, _, d in batch])), len(batch))
+                except Exception as error:
+                    logger.warning("Batched planning failed, planning %d questions one by one: %s", len(batch), error)
+            with self._lock:
+                self.batched += len(replies)
+            metrics.inc("plan_batch_questions_total", len(replies), result="batched")
+
+            singles = 0
+            for i, (question, future, deadline) in enumerate(batch):
+                if i in replies:
+                    future.set_result(replies[i])
+                else:
+                    singles += 1
+                    self.executor.submit(self._call, question, deadline).add_done_callback(
+                        lambda done, future=future: self._resolve(future, done))
+            metrics.inc("plan_batch_questions_total", singles, result="single")
+
+    def _resolve(self, future, done):
+        error = done.exception()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(done.result())
+
+    def stats(self):
+        return {"questions": self.questions, "shared": self.shared, "batched": self.batched,
+                "llm_calls": self.llm_calls,
+                "calls_per_question": round(self.llm_calls / self.questions, 3) if self.questions else 0.0}
+
+
+# LOCAL QUERY EXTRACTION
+price_pattern = re.compile(r"\b(?:under|below|less than|cheaper than|up to|within|max(?:imum)?(?: price)?(?: of)?)"
+                           r"\s*(?:\$|usd|rs\.?|₹)?\s*(\d[\d,]*(?:\.\d+)?)", re.I)
+platform_pattern = re.compile(r"\b(?:on|from|at|in)\s+(amazon|walmart)\b", re.I)
+size_pattern = re.compile(r"\(?\bsize\s*:?\s*([\w.]+)\)?", re.I)
+lead_pattern = re.compile(r"^(?:hi|hey|please|can you|could you|i(?:'d| would)? (?:like|love) to buy|i (?:need|want)(?: to buy)?|"
+                          r"i'?m looking for|looking for|find me|show me|search for|get me|buy|a|an|the|some)\b\s*", re.I)
+# Clauses about deadlines, coupons or returns that the planner turns into other tools.
+tail_pattern = re.compile(r"\s+(?:that|which|who|and can|and could|but|can it|can they|if|with a return|by (?:mon|tue|wed|thu|fri|sat|sun)\w*)\b.*$", re.I)
+
+
+def extract_params(question: str):
+    """
+    Quick local guess at the planner's search params: query, platform, max_price, size.
+    """
+    params = {"platform": "all"}
+    text = question.strip()
+
+    price = price_pattern.search(text)
+    if price:
+        params["max_price"] = int(float(price.group(1).replace(",", "")))
+        text = text[:price.start()] + text[price.end():]
+    platform = platform_pattern.search(text)
+    if platform:
+        params["platform"] = platform.group(1).lower()
+        text = text[:platform.start()] + text[platform.end():]
+    size = size_pattern.search(text)
+    if size:
+        params["size"] = size.group(1)
+        text = text[:size.start()] + text[size.end():]
+
+    for _ in range(3):
+        text = lead_pattern.sub("", text.strip(" ,.?!"))
+    text = tail_pattern.sub("", text)
+    text = re.sub(r"[^\w\s'-]", " ", text)
+    text = re.sub(r"\s+(?:for|on|from|at|in|with|of|a|an|the)\s*$", "", text.strip(), flags=re.I)
+    params["query"] = re.sub(r"\s+", " ", text).strip() or question.strip()
+    return params
+
+
+# SPECULATIVE FETCH
+class Speculation:
+    def __init__(self, tools, question: str, deadline=None, stats: dict = None):
+        """
+        Platform searches started from extract_params(question) while the planner runs.
+        tools is the shared Tools instance; stats collects hit / miss / unused counts.
+        """
+        self.tools = tools
+        self.question = question
+        self.deadline = deadline
+        self.stats = stats if stats is not None else {}
+        self.params = None
+        self.futures = {}
+
+    def start(self):
+        self.params = extract_params(self.question)
+        for platform, adapter in self.tools.select_platforms(self.params).items():
+            # The search runs on the platform loop and inherits this context (trace, priority).
+            self.futures[platform] = asyncio.run_coroutine_threadsafe(
+                adapter.asearch(dict(self.params), self.deadline), get_loop())
+        logger.debug("Speculative search %s", self.params)
+
+    def reconcile(self, params: dict, tools: dict):
+        """
+        Keep the speculative searches whose search key matches the plan's and cancel the rest.
+        Returns {platform: future} to hand to the pipeline.
+        """
+        reusable = {}
+        if not self.futures:
+            return reusable
+        searching = tools.get('search_products') or tools.get('price_comparison')
+        selected = self.tools.select_platforms(params) if searching and 'query' in params else {}
+        for platform, future in self.futures.items():
+            adapter = self.tools.platforms_map[platform]
+            if platform in selected and adapter.search_key(params) == adapter.search_key(self.params):
+                result = "hit"
+                reusable[platform] = future
+            else:
+                result = "miss" if platform in selected else "unused"
+                future.cancel()
+            self.stats[result] = self.stats.get(result, 0) + 1
+            metrics.inc("speculation_total", platform=platform, result=result)
+        return reusable
+
+
+# STRUCTURED TOOL CALLS
+def call_arguments(call: dict):
+    """
+    Decoded arguments of a tool call {"id", "name", "arguments"}; malformed JSON counts as none.
+    """
+    try:
+        arguments = json.loads(call.get("arguments") or "{}")
+    except json.JSONDecodeError:
+        logger.warning("Malformed arguments for %s: %r", call.get("name"), call.get("arguments"))
+        return {}
+    return arguments if isinstance(arguments, dict) else {}
+
+
+def search_calls(calls: list):
+    """
+    The search_products calls that become actions, in order.
+    """
+    return [call for call in calls if call["name"] == "search_products" and call_arguments(call).get("query")]
+
+
+def plan_calls(calls: list):
+    """
+    Turn one step's tool calls into independent (tools, params) actions: one per
+    search_products call, with the step's filter calls applied to each of them.
+    """
+    filters, flags = {}, {}
+    for call in calls:
+        if call["name"] != "search_products" and call["name"] in all_tools:
+            flags[call["name"]] = True
+            # The search decides the platform; a filter's platform only narrows what it checks.
+            filters.update({k: v for k, v in call_arguments(call).items() if k != "platform" and v not in (None, "")})
+
+    actions = []
+    for search in map(call_arguments, search_calls(calls)):
+        tools = {name: False for name in all_tools}
+        tools.update(flags, search_products=True)
+        params = {**filters, **{k: v for k, v in search.items() if v not in (None, "")}}
+        params["platform"] = str(params.get("platform", "all")).lower()
+        if params["platform"] not in ("all", "amazon", "walmart"):
+            params["platform"] = "all"
+        actions.append((tools, params))
+    return actions
+
+
+def action_key(action: tuple):
+    """
+    Identity of an action, so a step that repeats an earlier one can be skipped.
+    """
+    tools, params = action
+    return canonical_params({**params, "tools": ",".join(sorted(k for k, v in tools.items() if v))})
+
+
+def render_plan(actions: list):
+    """
+    The actions as text-planner Action lines, so a session's history reads the same in both modes.
+    """
+    lines = []
+    for tools, params in actions:
+        flags = ", ".join(f"{name} : True" for name, used in tools.items() if used)
+        values = ", ".join(f"{k}:{v}" if isinstance(v, (int, float)) else f'{k}:"{v}"' for k, v in params.items())
+        lines.append(f"- **Action:** necessary tools = {{{flags}}} | params = {{{values}}}")
+    return "\n".join(lines)
@@ -0,0 +1,146 @@
+import sys
+
+import numpy as np
+
+from src.template import product_output_format
+
+
+# Typed columns; every other column holds Python objects (mostly strings).
+float_columns = ("price", "ratings", "discount_price")
+date_columns = ("delivery_date",)
+# Low-cardinality strings that repeat across products and are interned on ingest.
+interned_columns = ("platform", "delivery_info", "return_policy")
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# PRODUCT BATCH
+class ProductBatch:
+    def __init__(self, columns: dict, age: float = None):
+        """
+        Column-oriented set of formatted products.
+        Prices and ratings are float64 arrays (NaN for missing), delivery dates are
+        datetime64 arrays (NaT for missing) and everything else is an object array.
+        age is how many seconds ago the products were fetched when they come from local
+        storage rather than the platform, else None; transforms keep it.
+        Batches are never mutated in place; every operation returns a new batch.
+        """
+        self.columns = columns
+        self.age = age
+
+    @classmethod
+    def from_columns(cls, **columns):
+        """
+        Build a batch in bulk from per-column lists of raw values.
+        """
+        typed = {}
+        for name, values in columns.items():
+            if isinstance(values, np.ndarray) and values.dtype != object:
+                # Already vectorized (e.g. computed from other columns).
+                typed[name] = values
+            elif name in float_columns:
+                typed[name] = np.fromiter((to_float(v) for v in values), dtype=np.float64, count=len(values))
+            elif name in date_columns:
+                typed[name] = np.array([v if v is not None else "NaT" for v in values], dtype="datetime64[m]")
+            elif name in interned_columns:
+                typed[name] = np.fromiter((sys.intern(v) if isinstance(v, str) else v for v in values),
+                                          dtype=object, count=len(values))
+            else:
+                typed[name] = np.fromiter(values, dtype=object, count=len(values))
+        return cls(typed)
+
+    @classmethod
+    def from_dicts(cls, products: list):
+        """
+        Build a batch from product dicts in the product_output_format schema.
+        """
+        names = list(product_output_format)
+        for product in products:
+            names.extend(k for k in product if k not in names)
+        return cls.from_columns(**{name: [p.get(name) for p in products] for name in names})
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    # Vectorized predicates
+    def valid_mask(self, required=None):
+        """
+        True for products whose required columns are all present.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for name in required or product_output_format:
+            column = self.columns.get(name)
+            if column is None:
+                continue
+            if column.dtype == np.float64:
+                mask &= ~np.isnan(column)
+            elif np.issubdtype(column.dtype, np.datetime64):
+                mask &= ~np.isnat(column)
+            else:
+                mask &= column != None  # noqa: E711  (elementwise on object arrays)
+        return mask
+
+    def price_mask(self, max_price):
+        return self.columns["price"] <= max_price
+
+    def shipping_mask(self, deadline):
+        """
+        True for products delivered on or before the deadline (a datetime64).
+        Products with no known delivery date never pass.
+        """
+        column = self.columns.get("delivery_date")
+        if column is None:
+            return np.zeros(len(self), dtype=bool)
+        return column <= deadline
+
+    # Transforms
+    def filter(self, mask):
+        return ProductBatch({name: column[mask] for name, column in self.columns.items()}, self.age)
+
+    def sort_by(self, name):
+        order = np.argsort(self.columns[name], kind="stable")
+        return ProductBatch({n: column[order] for n, column in self.columns.items()}, self.age)
+
+    def with_columns(self, **columns):
+        """
+        New batch sharing the existing columns plus the given ones.
+        """
+        added = ProductBatch.from_columns(**columns).columns if columns else {}
+        return ProductBatch({**self.columns, **added}, self.age)
+
+    # Edges
+    def to_dicts(self):
+        """
+        Convert back to the product dict format used by the UI and the cache.
+        """
+        names = list(self.columns)
+        lists = []
+        for name in names:
+            column = self.columns[name]
+            if column.dtype == np.float64:
+                lists.append([None if np.isnan(v) else v for v in column.tolist()])
+            elif np.issubdtype(column.dtype, np.datetime64):
+                lists.append([None if np.isnat(v) else str(v) for v in column])
+            else:
+                lists.append(column.tolist())
+        return [dict(zip(names, row)) for row in zip(*lists)]
+
+    @classmethod
+    def concat(cls, batches: list):
+        """
+        Stack batches that share the same columns, e.g. one per fetched page.
+        """
+        if not batches:
+            return cls.from_dicts([])
+        return cls({name: np.concatenate([b.columns[name] for b in batches]) for name in batches[0].columns})
@@ -0,0 +1,189 @@
+import asyncio
+from contextlib import contextmanager
+import contextvars
+import hashlib
+import heapq
+import itertools
+import os
+import time
+
+from src.Metrics import metrics
+
+# Lower value is served first.
+priorities = {"interactive": 0, "batch": 1}
+
+# Priority of the work running in this context; the batch runner lowers it.
+current_priority = contextvars.ContextVar("current_priority", default="interactive")
+
+# One limiter per (host, API key), shared by every client that uses the pair.
+limiters = {}
+
+
+@contextmanager
+def priority(level: str):
+    """
+    Run the enclosed platform requests at the given priority ("interactive" or "batch").
+    """
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class QuotaExhausted(Exception):
+    """
+    Raised instead of sending a request that the remaining quota cannot afford.
+    """
+
+
+# TOKEN BUCKET WITH PRIORITY QUEUE
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """
+        `rate` requests per second with bursts of up to `burst`. Callers that have to
+        wait are served in priority order, then first come first served.
+        Must be used from a single event loop (the platform I/O loop).
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.timer = None
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, level: str = "interactive", timeout: float = None):
+        self.refill()
+        if not self.waiters and self.tokens >= 1 and time.monotonic() >= self.paused_until:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priorities.get(level, 0), next(self.sequence), future))
+        self.schedule()
+        metrics.inc("ratelimit_waits_total", priority=level)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            # Cancelled or timed out: the slot is skipped when its turn comes.
+            future.cancel()
+            raise
+
+    def pause(self, seconds: float):
+        """
+        Send nothing for `seconds`, e.g. after a 429 with Retry-After.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0)
+
+    def schedule(self):
+        if self.timer is not None or not self.waiters:
+            return
+        delay = max((1 - self.tokens) / self.rate, self.paused_until - time.monotonic(), 0)
+        self.timer = asyncio.get_running_loop().call_later(delay, self.release)
+
+    def release(self):
+        self.timer = None
+        self.refill()
+        while self.waiters and self.tokens >= 1 and time.monotonic() >= self.paused_until:
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+        # Drop cancelled waiters at the head so they do not hold up the timer.
+        while self.waiters and self.waiters[0][2].done():
+            heapq.heappop(self.waiters)
+        self.schedule()
+
+
+# QUOTA-AWARE LIMITER
+class RateLimiter:
+    def __init__(self, name: str, rate: float = 5.0, burst: float = 10.0, reserve: float = 0.1):
+        """
+        Per-second rate limit plus the monthly quota reported by RapidAPI's
+        x-ratelimit-requests-* response headers. Once the remaining quota drops to
+        `reserve` of the limit, batch requests are refused and callers should prefer
+        cached results; interactive requests still go through until it is used up.
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.reserve = reserve
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self.requests = 0
+        self.throttled = 0
+
+    def low(self):
+        """
+        True when the remaining quota is within the reserve.
+        """
+        if self.remaining is None or self.limit is None:
+            return False
+        if self.reset_at is not None and time.time() >= self.reset_at:
+            return False
+        return self.remaining <= self.limit * self.reserve
+
+    def affordable(self, level: str):
+        if not self.low():
+            return True
+        return level == "interactive" and self.remaining > 0
+
+    async def acquire(self, deadline=None):
+        level = current_priority.get()
+        if not self.affordable(level):
+            metrics.inc("ratelimit_refused_total", limiter=self.name, priority=level)
+            raise QuotaExhausted(f"{self.name} quota is low ({self.remaining} left), {level} request refused")
+        await self.bucket.acquire(level, deadline.timeout() if deadline else None)
+        self.requests += 1
+
+    def update(self, response):
+        """
+        Track quota from the response headers and back off on 429.
+        """
+        headers = response.headers
+        if "x-ratelimit-requests-limit" in headers:
+            self.limit = int(headers["x-ratelimit-requests-limit"])
+        if "x-ratelimit-requests-remaining" in headers:
+            self.remaining = int(headers["x-ratelimit-requests-remaining"])
+            metrics.set_gauge("quota_remaining", self.remaining, limiter=self.name)
+        if "x-ratelimit-requests-reset" in headers:
+            self.reset_at = time.time() + int(headers["x-ratelimit-requests-reset"])
+        if response.status_code == 429:
+            self.throttled += 1
+            metrics.inc("ratelimit_throttled_total", limiter=self.name)
+            self.bucket.pause(float(headers.get("retry-after", 1)))
+
+    def stats(self):
+        return {"requests": self.requests, "throttled": self.throttled, "quota_limit": self.limit,
+                "quota_remaining": self.remaining, "low": self.low(),
+                "waiting": sum(not future.done() for _, _, future in self.bucket.waiters)}
+
+
+def limiter_for(host: str, api_key: str):
+    """
+    Shared limiter for a host and API key, configured from RAPID_API_RATE,
+    RAPID_API_BURST and QUOTA_RESERVE.
+    Buckets live in the process, so the rate and burst are split evenly between the
+    SEARCH_API_WORKERS server processes to keep their sum within RAPID_API_RATE.
+    The quota needs no sharing: every response reports the key's remaining requests.
+    """
+    key_id = hashlib.sha1((api_key or "").encode("utf-8")).hexdigest()[:8]
+    name = f"{host}:{key_id}"
+    if name not in limiters:
+        workers = max(1, int(os.getenv("SEARCH_API_WORKERS", 1)))
+        limiters[name] = RateLimiter(name, rate=float(os.getenv("RAPID_API_RATE", 5)) / workers,
+                                     burst=max(1.0, float(os.getenv("RAPID_API_BURST", 10)) / workers),
+                                     reserve=float(os.getenv("QUOTA_RESERVE", 0.1)))
+    return limiters[name]
+
+
+def stats():
+    return {name: limiter.stats() for name, limiter in limiters.items()}
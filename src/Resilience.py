@@ -0,0 +1,272 @@
+import asyncio
+from collections import deque
+import os
+import random
+import threading
+import time
+
+from src.Metrics import metrics
+
+# Every named policy, for health reporting.
+policies = {}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling the upstream while its circuit is open.
+    """
+
+
+# CIRCUIT BREAKER
+class CircuitBreaker:
+    closed, half_open, open = "closed", "half_open", "open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        """
+        Opens after failure_threshold consecutive failures and rejects calls for
+        reset_timeout seconds. Then one probe call is let through: success closes
+        the circuit, failure opens it again.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Return the state the call is admitted in (closed, or half_open for the probe),
+        or None when it is rejected.
+        """
+        with self._lock:
+            if self.state == self.open and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._set(self.half_open)
+            if self.state == self.closed:
+                return self.closed
+            if self.state == self.half_open and not self.probing:
+                self.probing = True
+                return self.half_open
+            return None
+
+    def release_probe(self):
+        """
+        Let another probe through, e.g. when the probe was cancelled without an outcome.
+        """
+        with self._lock:
+            self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != self.closed:
+                self._set(self.closed)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.half_open or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                if self.state != self.open:
+                    self._set(self.open)
+
+    def _set(self, state):
+        self.state = state
+        metrics.set_gauge("circuit_open", 1 if state == self.open else 0, circuit=self.name)
+        metrics.inc("circuit_transitions_total", circuit=self.name, state=state)
+
+
+# RETRY BUDGET
+class RetryBudget:
+    def __init__(self, ratio: float = 0.2, minimum: float = 10.0, maximum: float = 100.0):
+        """
+        Retries may add at most `ratio` extra load on top of regular calls, plus a small
+        reserve so a quiet upstream can still be retried. Stops retry storms in an outage.
+        """
+        self.ratio = ratio
+        self.maximum = maximum
+        self.tokens = minimum
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+def backoff(attempt: int, base: float, cap: float):
+    """
+    Full-jitter exponential backoff.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# RESILIENCE POLICY
+class Resilience:
+    def __init__(self, name: str, retryable, retries: int = 2, base_delay: float = 0.1, max_delay: float = 1.0,
+                 failure_threshold: int = 5, reset_timeout: float = 10.0, hedge: bool = False,
+                 hedge_min_samples: int = 20):
+        """
+        Circuit breaker, budgeted jittered retries and optional hedging for one upstream.
+        retryable(error) decides which errors are transient upstream failures; any other
+        error is raised at once and does not count against the circuit.
+        With hedge=True a duplicate call is started when the first one is slower than the
+        observed p95, and the first success wins. Only use it for idempotent calls.
+        """
+        self.name = name
+        self.retryable = retryable
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.budget = RetryBudget()
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = deque(maxlen=500)
+        self.counts = {"calls": 0, "failures": 0, "retries": 0, "rejected": 0, "hedges": 0, "hedge_wins": 0}
+        policies[name] = self
+
+    def count(self, key):
+        self.counts[key] += 1
+        metrics.inc(f"resilience_{key}_total", upstream=self.name)
+
+    def p95(self):
+        if len(self.latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def admit(self):
+        admitted = self.breaker.acquire()
+        if admitted is None:
+            self.count("rejected")
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        self.count("calls")
+        self.budget.deposit()
+        return admitted
+
+    def retry_delay(self, error, attempt: int, deadline=None):
+        """
+        Record a failure and return how long to wait before retrying, or None to give up.
+        """
+        if not self.retryable(error):
+            return None
+        self.count("failures")
+        self.breaker.record_failure()
+        if attempt >= self.retries or self.breaker.state == CircuitBreaker.open or not self.budget.withdraw():
+            return None
+        delay = backoff(attempt, self.base_delay, self.max_delay)
+        remaining = deadline.remaining() if deadline else None
+        if remaining is not None and remaining <= delay:
+            return None
+        self.count("retries")
+        return delay
+
+    def succeeded(self, started: float):
+        self.latencies.append(time.monotonic() - started)
+        self.breaker.record_success()
+
+    async def acall(self, coro_fn, deadline=None):
+        """
+        Await coro_fn() under the policy.
+        """
+        admitted = self.admit()
+        attempt = 0
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    result = await (self._hedged(coro_fn) if self.hedge else coro_fn())
+                except Exception as error:
+                    delay = self.retry_delay(error, attempt, deadline)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                self.succeeded(started)
+                return result
+        finally:
+            if admitted == CircuitBreaker.half_open:
+                self.breaker.release_probe()
+
+    async def _hedged(self, coro_fn):
+        threshold = self.p95()
+        if threshold is None:
+            return await coro_fn()
+        first = asyncio.ensure_future(coro_fn())
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=threshold)
+            if not done:
+                # Slower than p95: race a duplicate against it.
+                self.count("hedges")
+                tasks.add(asyncio.ensure_future(coro_fn()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def call(self, fn, deadline=None):
+        """
+        Blocking variant for threads, without hedging.
+        """
+        admitted = self.admit()
+        attempt = 0
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    result = fn()
+                except Exception as error:
+                    delay = self.retry_delay(error, attempt, deadline)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                self.succeeded(started)
+                return result
+        finally:
+            if admitted == CircuitBreaker.half_open:
+                self.breaker.release_probe()
+
+    def health(self):
+        p95 = self.p95()
+        return {"state": self.breaker.state, **self.counts, "p95_s": round(p95, 4) if p95 is not None else None}
+
+
+def from_env(name: str, retryable, hedge: bool = False):
+    """
+    Policy configured from RESILIENCE_RETRIES, BREAKER_FAILURES, BREAKER_RESET_S and
+    HEDGE_REQUESTS (hedging must also be requested by the caller).
+    """
+    return Resilience(name, retryable,
+                      retries=int(os.getenv("RESILIENCE_RETRIES", 2)),
+                      failure_threshold=int(os.getenv("BREAKER_FAILURES", 5)),
+                      reset_timeout=float(os.getenv("BREAKER_RESET_S", 10)),
+                      hedge=hedge and os.getenv("HEDGE_REQUESTS", "1") != "0")
+
+
+def health():
+    return {name: policy.health() for name, policy in policies.items()}
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+
+from src.Metrics import metrics
+
+
+# SINGLE-FLIGHT REQUEST COALESCING
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stream:
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.items = []
+        self.done = False
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str = "flight"):
+        """
+        Collapse concurrent calls that share a key into one upstream call.
+        Callers that arrive while a call is in flight wait for it and share its result.
+        """
+        self.name = name
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._tasks = {}
+        self._waiters = {}
+        self._streams = {}
+
+    def do(self, key, fn):
+        """
+        Blocking variant for threads: run fn() once per in-flight key.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.shared += 1
+        metrics.inc("singleflight_calls_total", flight=self.name, shared=not leader)
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as error:
+                call.error = error
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key, gen_fn):
+        """
+        Generator variant for streamed replies: iterate gen_fn() once per in-flight key.
+        Callers that join late get the items produced so far, then follow along live.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._streams.get(key)
+            leader = call is None
+            if leader:
+                call = self._streams[key] = _Stream()
+            else:
+                self.shared += 1
+        metrics.inc("singleflight_calls_total", flight=self.name, shared=not leader)
+
+        if leader:
+            try:
+                for item in gen_fn():
+                    with call.changed:
+                        call.items.append(item)
+                        call.changed.notify_all()
+                    yield item
+            except Exception as error:
+                call.error = error
+                raise
+            finally:
+                # Also runs when the leader stops early; followers end where it ended.
+                with self._lock:
+                    del self._streams[key]
+                with call.changed:
+                    call.done = True
+                    call.changed.notify_all()
+            return
+
+        seen = 0
+        while True:
+            with call.changed:
+                while seen == len(call.items) and not call.done:
+                    call.changed.wait()
+                items, done = call.items[seen:], call.done
+            seen += len(items)
+            yield from items
+            if done:
+                break
+        if call.error is not None:
+            raise call.error
+
+    async def ado(self, key, coro_fn):
+        """
+        Async variant for the event loop: await coro_fn() once per in-flight key.
+        The shared call is cancelled only when every caller waiting on it is cancelled.
+        """
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get(key)
+            leader = task is None
+            if leader:
+                task = self._tasks[key] = asyncio.ensure_future(coro_fn())
+                task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            else:
+                self.shared += 1
+            self._waiters[task] = self._waiters.get(task, 0) + 1
+        metrics.inc("singleflight_calls_total", flight=self.name, shared=not leader)
+        # Shield so one cancelled waiter does not cancel the shared call.
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            with self._lock:
+                abandoned = self._waiters.get(task) == 1
+            if abandoned:
+                task.cancel()
+            raise
+        finally:
+            with self._lock:
+                self._waiters[task] -= 1
+                if not self._waiters[task]:
+                    del self._waiters[task]
+
+    def _forget(self, key, task):
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared,
+                "dedup_rate": round(self.shared / self.calls, 3) if self.calls else 0.0}
@@ -0,0 +1,201 @@
+import asyncio
+from collections import OrderedDict
+import hashlib
+import io
+import logging
+import os
+import threading
+import urllib.parse
+
+import httpx
+from PIL import Image, features
+
+from src.Client import retryable_http, run_sync
+from src.Metrics import metrics
+from src import Resilience
+from src.SingleFlight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Product image CDNs the proxy fetches from; anything else is refused.
+default_hosts = ("m.media-amazon.com", "images-na.ssl-images-amazon.com", "i5.walmartimages.com")
+media_types = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+# THUMBNAIL CACHE
+class ThumbnailCache:
+    def __init__(self, path: str = "thumbnails", max_bytes: int = 256 * 2 ** 20, image_format: str = "webp",
+                 quality: int = 80, max_width: int = 600, max_source_bytes: int = 8 * 2 ** 20, hosts=default_hosts):
+        """
+        Product images fetched once, downscaled to the requested width, re-encoded as WebP
+        (JPEG if Pillow lacks WebP) and kept on disk under path, evicting the least recently
+        used files past max_bytes. Each thumbnail's ETag is its cache key, so it is known
+        before the file is read. Fetches run on the shared background loop.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.format = image_format if image_format == "jpeg" or features.check("webp") else "jpeg"
+        self.quality = quality
+        self.max_width = max_width
+        self.max_source_bytes = max_source_bytes
+        self.hosts = set(hosts)
+        self.flight = SingleFlight("thumbnail")
+        self.resilience = Resilience.from_env("thumbnails", retryable_http)
+        self.counts = {"hits": 0, "misses": 0, "evictions": 0}
+        self._client = None
+        self._lock = threading.Lock()
+        # key -> file size, least recently used first.
+        self._files = OrderedDict()
+        self._bytes = 0
+        os.makedirs(path, exist_ok=True)
+        entries = [entry for entry in os.scandir(path) if entry.name.endswith(f".{self.format}")]
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            key = entry.name[:-len(self.format) - 1]
+            self._files[key] = entry.stat().st_size
+            self._bytes += entry.stat().st_size
+
+    @property
+    def media_type(self):
+        return media_types[self.format]
+
+    def key(self, url: str, width: int):
+        return hashlib.sha1(f"{url}|{width}|{self.format}|{self.quality}".encode()).hexdigest()
+
+    def etag(self, url: str, width: int):
+        return f'"{self.key(url, width)}"'
+
+    def check(self, url: str, width: int):
+        """
+        Validate a request; returns the width actually served. Raises ValueError.
+        """
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme not in ("http", "https") or parsed.hostname not in self.hosts:
+            raise ValueError(f"Image host not allowed: {parsed.hostname}")
+        return max(16, min(int(width), self.max_width))
+
+    # Disk LRU
+    def file(self, key: str):
+        return os.path.join(self.path, f"{key}.{self.format}")
+
+    def read(self, key: str):
+        with self._lock:
+            if key not in self._files:
+                return None
+            self._files.move_to_end(key)
+        try:
+            with open(self.file(key), "rb") as f:
+                data = f.read()
+            # The file's mtime orders the LRU across restarts.
+            os.utime(self.file(key))
+        except OSError:
+            # Evicted by a concurrent write (or unreadable): a miss.
+            with self._lock:
+                if not os.path.exists(self.file(key)):
+                    self._bytes -= self._files.pop(key, 0)
+            return None
+        return data
+
+    def write(self, key: str, data: bytes):
+        temporary = f"{self.file(key)}.{threading.get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, self.file(key))
+        with self._lock:
+            self._bytes += len(data) - self._files.pop(key, 0)
+            self._files[key] = len(data)
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                old, size = self._files.popitem(last=False)
+                self._bytes -= size
+                self.counts["evictions"] += 1
+                try:
+                    os.remove(self.file(old))
+                except FileNotFoundError:
+                    pass
+
+    # Fetch and resize
+    def client(self):
+        if self._client is None:
+            # Redirects are not followed: they could lead off the allowed hosts.
+            self._client = httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=3.0),
+                                             limits=httpx.Limits(max_connections=20, max_keepalive_connections=10))
+        return self._client
+
+    async def fetch(self, url: str):
+        async def attempt():
+            with metrics.span("thumbnail_fetch"):
+                async with self.client().stream("GET", url) as response:
+                    response.raise_for_status()
+                    chunks, size = [], 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        if size > self.max_source_bytes:
+                            raise ValueError(f"Image larger than {self.max_source_bytes} bytes: {url}")
+                        chunks.append(chunk)
+                    return b"".join(chunks)
+
+        return await self.resilience.acall(attempt)
+
+    def resize(self, data: bytes, width: int):
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", (width, width))
+            image.thumbnail((width, width * 4))
+            if self.format == "jpeg" and image.mode != "RGB":
+                # JPEG has no alpha: flatten onto white.
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+                image = background
+            elif image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA")
+            output = io.BytesIO()
+            image.save(output, self.format.upper(), quality=self.quality)
+        return output.getvalue()
+
+    async def aget(self, url: str, width: int):
+        key = self.key(url, width)
+        data = self.read(key)
+        if data is not None:
+            self.counts["hits"] += 1
+            metrics.inc("thumbnail_requests_total", result="hit")
+            return data
+
+        async def create():
+            self.counts["misses"] += 1
+            metrics.inc("thumbnail_requests_total", result="miss")
+            source = await self.fetch(url)
+            loop = asyncio.get_running_loop()
+            with metrics.span("thumbnail_resize"):
+                thumbnail = await loop.run_in_executor(None, self.resize, source, width)
+            await loop.run_in_executor(None, self.write, key, thumbnail)
+            return thumbnail
+
+        return await self.flight.ado(key, create)
+
+    def get(self, url: str, width: int = 150):
+        """
+        Thumbnail bytes for an image URL, fetched and resized on the first request.
+        Raises ValueError for disallowed hosts and the fetch or decode error otherwise.
+        """
+        width = self.check(url, width)
+        return run_sync(self.aget(url, width))
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._bytes, "format": self.format, **self.counts}
+
+    def close(self):
+        if self._client is not None:
+            run_sync(self._client.aclose())
+            self._client = None
+
+
+def from_env():
+    """
+    Cache configured from THUMBNAIL_PATH, THUMBNAIL_CACHE_MB, THUMBNAIL_FORMAT,
+    THUMBNAIL_QUALITY and THUMBNAIL_HOSTS (comma-separated).
+    """
+    hosts = os.getenv("THUMBNAIL_HOSTS")
+    return ThumbnailCache(path=os.getenv("THUMBNAIL_PATH", "thumbnails"),
+                          max_bytes=int(float(os.getenv("THUMBNAIL_CACHE_MB", 256)) * 2 ** 20),
+                          image_format=os.getenv("THUMBNAIL_FORMAT", "webp").lower(),
+                          quality=int(os.getenv("THUMBNAIL_QUALITY", 80)),
+                          hosts=hosts.split(",") if hosts else default_hosts)
@@ -1,564 +1,474 @@
-import calendar
-from copy import deepcopy
 import concurrent.futures
-from datetime import datetime, timedelta
-import http.client
-import json
+import logging
 import os
-import pytz
 import re
-import random
-import urllib.parse
 
 from dotenv import load_dotenv
-
-from src.template import product_output_format
+import numpy as np
+
+from src.Cache import ResultCache, canonical_params
+from src.Catalog import Catalog
+from src.Delivery import delivery_dates
+from src.Client import PlatformClient, fetch_pages, run_sync
+from src.Matching import MatchIndex
+from src.Metrics import metrics
+from src.Pipeline import Pipeline, RequestContext
+from src.RateLimit import limiter_for
+from src.Product import ProductBatch
+from src.SingleFlight import SingleFlight
 
 load_dotenv()
 
-def convert_day_to_date(target_day):
-    
-    ist = pytz.timezone('Asia/Kolkata')
-    # Get today's date and current weekday index
-    today = datetime.now(ist)
-    today_index = today.weekday()  
+logger = logging.getLogger(__name__)
 
-    # Convert input day name to an index (case insensitive)
-    target_day = target_day.capitalize()  # Ensure first letter is uppercase
-    if target_day not in calendar.day_name:
-        return "Invalid day name. Please enter a valid day (e.g., 'Friday')."
+def enough_products(min_results: int, max_price=None):
+    """
+    Early-termination check for fetch_pages: enough valid products within max_price.
+    """
+    max_price = float('inf') if max_price is None else float(max_price)
 
-     # Get index of target day
-    target_index = list(calendar.day_name).index(target_day) 
+    def enough(batches):
+        matching = sum(int((b.valid_mask() & b.price_mask(max_price)).sum()) for b in batches)
+        return matching >= min_results
+    return enough
 
-    # Calculate days until the next occurrence of the given day
-    days_until = (target_index - today_index) % 7 
-    if days_until == 0:  
-        days_until = 7
 
-    next_day_date = today + timedelta(days=days_until)
-    
-    return next_day_date
+def search_filters(params: dict):
+    """
+    Search parameters other than the query, price limit and the filter tools' own
+    arguments (deadline, coupon_code), e.g. size or brand.
+    The catalog's full-text index cannot check them, so searches with any are only
+    answered locally from the exact same search.
+    """
+    return {k: v for k, v in params.items() if k not in ("query", "platform", "max_price", "deadline", "coupon_code") and v}
 
 
 # AMAZON API CLASS
 class Amazon:
-    def __init__(self):
-        # Initialize the HTTPS connection and headers for the Amazon API.
-        self.conn = http.client.HTTPSConnection("real-time-amazon-data.p.rapidapi.com")
-        self.headers = {
+    def __init__(self, cache=None, flight=None, max_pages=3, min_results=20, catalog=None):
+        # Pooled async connection and headers for the Amazon API.
+        self.client = PlatformClient("real-time-amazon-data.p.rapidapi.com", {
             'x-rapidapi-key': os.getenv("RAPID_API_KEY"),
             'x-rapidapi-host': "real-time-amazon-data.p.rapidapi.com"
-        }
-        # To be set during a search
-        self.params = {}   
-        # To be set by the Tools class          
-        self.product_op_format = {"platform": "amazon","product_id" : "","name": "" ,"price": 0,"product_url": '',"img_url" : '',"ratings" : '',"delivery_info" : '', "size" : 4,} 
-         # List to store fetched & formatted products 
-        self.all_products = []      
-
-    def search(self):
+        }, base_url=os.getenv("AMAZON_API_URL"),
+           limiter=limiter_for("real-time-amazon-data.p.rapidapi.com", os.getenv("RAPID_API_KEY")))
+        # Adapters hold no per-request state, so one instance serves every concurrent search.
+        # Shared ResultCache and SingleFlight for formatted search results
+        self.cache = cache
+        self.flight = flight
+        # Shared on-disk Catalog that answers warm searches locally.
+        self.catalog = catalog
+        # Pagination depth and how many in-budget products allow stopping early.
+        self.max_pages = max_pages
+        self.min_results = min_results
+
+    async def fetch_page(self, query: dict, page_number: int, deadline=None):
+        """
+        Fetch one page of raw Amazon search results.
+        """
+        data = await self.client.get_json("/search", params={**query, "page": page_number},
+                                          deadline=deadline)
+        # Check if valid product data is returned.
+        if "data" in data and "products" in data["data"]:
+            return data["data"]["products"] or []
+        return []
+
+    async def fetch_batch(self, query: dict, page_number: int, params: dict, deadline=None):
+        return self.format_products(await self.fetch_page(query, page_number, deadline), params)
+
+    def format_products(self, all_products: list, params: dict):
+        """
+        Format the raw products column by column into a ProductBatch.
+        """
+        size = params.get('size', 4)
+        return ProductBatch.from_columns(
+            platform=["amazon"] * len(all_products),
+            product_id=[prod.get('asin') for prod in all_products],
+            name=[prod.get('product_title') for prod in all_products],
+            # Remove non-digit characters and convert to float if possible.
+            price=[re.sub(r"[^\d.]", "", prod["product_price"]) if prod.get("product_price") else None
+                   for prod in all_products],
+            product_url=[prod.get('product_url') for prod in all_products],
+            img_url=[prod.get('product_photo') for prod in all_products],
+            ratings=[prod.get('product_star_rating') for prod in all_products],
+            delivery_info=[prod.get('delivery') for prod in all_products],
+            delivery_date=delivery_dates([prod.get('delivery') for prod in all_products]),
+            size=[prod.get('size', size) for prod in all_products],
+        )
+
+    def query_params(self, params: dict):
+        # Remove keys that are not meant to be part of the query string.
+        excluded_keys = {"deals_and_discounts", "platform", "max_price", "deadline", "coupon_code"}
+        return {k: str(v) for k, v in params.items() if k not in excluded_keys and v}
 
+    def search_key(self, params: dict):
         """
-        Search for products on Amazon using the provided parameters.
+        Cache key for the search; equal keys fetch exactly the same results.
         """
-        
-        params = self.params 
+        # max_price is part of the key because it decides how many pages are fetched.
+        return f"amazon:{canonical_params({**self.query_params(params), 'max_price': params.get('max_price')})}"
 
-        # Remove keys that are not meant to be part of the query string.
-        excluded_keys = {"deals_and_discounts", "platform", "max_price", "deadline"}
-        filtered_params = {k: v for k, v in params.items() if k not in excluded_keys and v}
-
-        # Build query 
-        query_string = "&".join(f"{key}={urllib.parse.quote_plus(str(value))}"
-                                for key, value in filtered_params.items())
-
-        page_number = 1
-        all_products = []
-
-        # Loop to fetch paginated results
-        while True:
-            paginated_query = f"{query_string}&page={page_number}"
-            url = f"/search?{paginated_query}"
-            self.conn.request("GET", url, headers=self.headers)
-            response = self.conn.getresponse()
-            data = json.loads(response.read().decode("utf-8"))
-            # Check if valid product data is returned.
-            if "data" in data and "products" in data["data"]:
-                products = data["data"]["products"]
-                if products:
-                    all_products.extend(products)
-                    page_number += 1
-                else:
-                    break
-            else:
-                break
+    async def asearch(self, params: dict, deadline=None):
 
-            # Limit to only the first page 
-            if page_number == 2:
-                break
+        """
+        Search for products on Amazon using the provided parameters.
+        """
 
-        # Format the raw products using the provided product output format.
-        formatted_products = []
-        for prod in all_products:
-            prod_data = deepcopy(self.product_op_format)
-            prod_data['platform'] = "amazon"
-            prod_data['product_id'] = prod.get('asin')
-            prod_data['name'] = prod.get('product_title')
-            price_str = prod.get("product_price")
-            # Remove non-digit characters and convert to float if possible.
-            prod_data['price'] = float(re.sub(r"[^\d.]", "", price_str).replace(",", "")) if price_str else None
-            prod_data['product_url'] = prod.get('product_url')
-            prod_data['img_url'] = prod.get('product_photo')
-            prod_data['ratings'] = prod.get('product_star_rating')
-            prod_data['delivery_info'] = prod.get('delivery')
-            prod_data['size'] = prod.get('size', params.get('size', 4))
-            formatted_products.append(prod_data)
+        filtered_params = self.query_params(params)
+        key = self.search_key(params)
+        if self.flight:
+            # Concurrent identical searches share one upstream call.
+            products = await self.flight.ado(key, lambda: self._search(key, filtered_params, params, deadline))
+        else:
+            products = await self._search(key, filtered_params, params, deadline)
+
+        # Batches are immutable, so a shared or cached result is safe to hand out.
+        return products
+
+    async def _search(self, key: str, filtered_params: dict, params: dict, deadline=None):
+        """
+        Fetch and format Amazon results, going through the result cache and the catalog.
+        """
+        cached = self.cache.get(key) if self.cache else None
+        if cached is None and self.cache and self.client.limiter.low():
+            # Quota is nearly used up: an expired result is better than spending it.
+            cached = self.cache.get(key, stale=True)
+        if cached is not None:
+            return ProductBatch.from_dicts(cached)
+
+        if self.catalog:
+            local = await self.catalog.alookup(key, "amazon", params['query'], params.get('max_price'), self.min_results,
+                                               fulltext=not search_filters(params))
+            if local is not None:
+                batch, age = local
+                if age > self.catalog.fresh_ttl:
+                    self.catalog.refresh(key, lambda: self._fetch(key, filtered_params, params))
+                return batch
+        try:
+            return await self._fetch(key, filtered_params, params, deadline)
+        except Exception as error:
+            # Platform unreachable: answer from the catalog, however old.
+            local = await self.catalog.aoffline(key, "amazon", params['query'], params.get('max_price'),
+                                                fulltext=not search_filters(params)) if self.catalog else None
+            if local is None:
+                raise
+            logger.warning("Amazon unavailable (%r), answering from the catalog", error)
+            return local[0]
+
+    async def _fetch(self, key: str, filtered_params: dict, params: dict, deadline=None):
+        # Fetch pages concurrently, stopping once enough products pass the price filter.
+        pages = await fetch_pages(lambda page_number: self.fetch_batch(filtered_params, page_number, params, deadline),
+                                  self.max_pages, enough_products(self.min_results, params.get('max_price')), deadline)
+        batch = ProductBatch.concat(pages)
 
         # Filter out products that may have missing essential fields.
-        formatted_products = [p for p in formatted_products if "None" not in str(p)]
-        self.all_products = formatted_products
-        # Sort the product based on the price
+        batch = batch.filter(batch.valid_mask())
+        # Results cut short by the deadline are incomplete: not cached or recorded as the search's result.
+        complete = not (deadline and deadline.expired())
+        if self.cache and complete:
+            self.cache.set(key, batch.to_dicts())
+        if self.catalog:
+            self.catalog.ingest(batch, key if complete else None, params['query'])
 
-        return formatted_products
+        return batch
+
+    def search(self, params: dict, deadline=None):
+        """
+        Blocking wrapper around asearch for the thread-based tools.
+        Raises TimeoutError if nothing returns before the deadline.
+        """
+        return run_sync(self.asearch(params, deadline), deadline.timeout() if deadline else None)
 
         
-    def discount_check(self):
+    def discount_check(self, batch: ProductBatch):
         
         """
         Calculates the discounted price as 90% of the original price.
         By default for all coupoun having 10%
         """
 
-        for product in self.all_products:
-            if product.get('price') is not None:
-                product['discount_price'] = round(product['price'] * 0.9, 2)
-            else:
-                product['discount_price'] = None
-        return  True
+        return batch.with_columns(discount_price=np.round(batch['price'] * 0.9, 2))
     
-    def shipping_time_estimate(self):
-        
+    def return_policy(self, batch: ProductBatch):
         """
-        Estimate shipping time by adding a random number (1-5) of days to the current date.
-        The products are then sorted by their estimated delivery date.
+        Randomly assign a return policy to each product.
+        Products without one (randomly determined) get None and are dropped by the pipeline.
         """
 
-        params = self.params
-        target_day = params['deadline'] 
-        deadline_time  = convert_day_to_date(target_day)
-
-        for idx,product in enumerate(self.all_products):
-            rand_days = random.randint(1, 11)
-            
-            est_delivery_date = (datetime.now(pytz.timezone('Asia/Kolkata')) + timedelta(days = rand_days))
-            check_est_delivery = (deadline_time - est_delivery_date).days
-
-            if check_est_delivery >= 0 :
-                est_delivery = datetime.now(pytz.timezone('Asia/Kolkata')) + timedelta(days=rand_days)
-                product['delivery_info'] = est_delivery.strftime('%Y-%m-%d %H:%M')
-            else:
-                del self.all_products[idx]
-
-        # Sort products based on the parsed delivery date.
-
-        return self.all_products
-
-    def return_policy(self):
-        """
-        Randomly assign a return policy to each product.
-        If no return policy is applicable (randomly determined), the product is removed.
-        """
-
-        filtered_products = []
-        for product in self.all_products:
-            rand_n = random.randint(1, 3)
-            if rand_n == 1:
-                product['return_policy'] = "2 days Return Policy"
-                filtered_products.append(product)
-            elif rand_n == 2:
-                product['return_policy'] = "3 days Return Policy"
-                filtered_products.append(product)
-            else:
-                # Skip the product to simulate lack of a return policy.
-                continue
-        self.all_products = filtered_products
-        return self.all_products
+        rand_n = np.random.randint(1, 4, size=len(batch))
+        policy = np.select([rand_n == 1, rand_n == 2], ["2 days Return Policy", "3 days Return Policy"], "")
+        return batch.with_columns(return_policy=np.where(rand_n == 3, None, policy.astype(object)))
 
 
 # WALMART API CLASS
 class Walmart:
-    def __init__(self):
+    def __init__(self, cache=None, flight=None, max_pages=3, min_results=20, catalog=None):
 
-        self.conn = http.client.HTTPSConnection("walmart-data.p.rapidapi.com")
-        self.headers = {
+        self.client = PlatformClient("walmart-data.p.rapidapi.com", {
             'x-rapidapi-key':  os.getenv("RAPID_API_KEY"),
             'x-rapidapi-host': "walmart-data.p.rapidapi.com"
-        }
-        # To be set during a search
-        self.params = {}   
-        # To be set by the Tools class                    
-        self.product_op_format = {"platform": "amazon","product_id" : "","name": "" ,"price": 0,"product_url": '',"img_url" : '',"ratings" : '',"delivery_info" : '', "size" : 4,}
-         # List to store fetched & formatted products
-        self.all_products = []      
-
-    def search(self):
-        
-        """
-        Search for products on Amazon using the provided parameters.
-        """
-        
-        params = self.params
-        # URL-encode the query string.
-        all_products = []
-        page = 1
-
-        # Loop to fetch paginated results 
-        while True:
-            request_url = f"/search?q={self.params['query'].replace(" ","%20")}&page={page}"
-            self.conn.request("GET", request_url, headers=self.headers)
-            response = self.conn.getresponse()
-            data = json.loads(response.read().decode("utf-8"))
-
-            if data.get('searchResult'):
-                # Assuming searchResult[0] is the list of products.
-                products = data['searchResult'][0]
-                if products:
-                    all_products.extend(products)
-                    page += 1
-                else:
-                    break
-            else:
-                break
-
-            # Limit to only the first page.
-            if page == 2:
-                break
-
-        # Format the raw products using the provided product output format.
-        formatted_products = []
+        }, base_url=os.getenv("WALMART_API_URL"),
+           limiter=limiter_for("walmart-data.p.rapidapi.com", os.getenv("RAPID_API_KEY")))
+        # Adapters hold no per-request state, so one instance serves every concurrent search.
+        # Shared ResultCache and SingleFlight for formatted search results
+        self.cache = cache
+        self.flight = flight
+        # Shared on-disk Catalog that answers warm searches locally.
+        self.catalog = catalog
+        # Pagination depth and how many in-budget products allow stopping early.
+        self.max_pages = max_pages
+        self.min_results = min_results
+
+    async def fetch_page(self, query: str, page: int, deadline=None):
+        """
+        Fetch one page of raw Walmart search results.
+        """
+        data = await self.client.get_json("/search", params={"q": query, "page": page},
+                                          deadline=deadline)
+        if data.get('searchResult'):
+            # Assuming searchResult[0] is the list of products.
+            return data['searchResult'][0] or []
+        return []
+
+    async def fetch_batch(self, query: str, page: int, params: dict, deadline=None):
+        return self.format_products(await self.fetch_page(query, page, deadline), params)
+
+    def format_products(self, all_products: list, params: dict):
+        """
+        Format the raw products column by column into a ProductBatch.
+        """
+        size = params.get('size', 4)
+        delivery_info, sla_text = [], []
         for prod in all_products:
-            prod_data = deepcopy(self.product_op_format)
-            prod_data['platform'] = "walmart"
-            prod_data['product_id'] = ""  # Walmart products may not have a unique id.
-            prod_data['name'] = prod.get("name")
-            prod_data['price'] = prod.get("price")
-            prod_data['product_url'] = prod.get('productLink')
-            prod_data['img_url'] = prod.get('image')
-            # Extract ratings if available.
-            prod_data['ratings'] = prod.get('rating', {}).get('averageRating') if prod.get('rating') else None
             # Format delivery info using fulfillment badge details if available.
             if prod.get('fulfillmentBadgeGroups'):
                 badge = prod['fulfillmentBadgeGroups'][0]
-                prod_data['delivery_info'] = f"{badge.get('text', '')} {badge.get('slaText', '')}".strip()
+                delivery_info.append(f"{badge.get('text', '')} {badge.get('slaText', '')}".strip())
+                sla_text.append(badge.get('slaText'))
             else:
-                prod_data['delivery_info'] = None
-            prod_data['size'] = prod.get('size', params.get('size', 4))
-            formatted_products.append(prod_data)
-
-        # Filter out products with missing essential fields.
-        formatted_products = [p for p in formatted_products if "None" not in str(p)]
-
-        # Sort the product based on the price
-        sorted(formatted_products, key = lambda x : x['price'])
-        self.all_products = formatted_products
-
-        return formatted_products
+                delivery_info.append(None)
+                sla_text.append(None)
+        return ProductBatch.from_columns(
+            platform=["walmart"] * len(all_products),
+            # Walmart's item id; products without one fall back to their link.
+            product_id=[str(prod.get("usItemId") or prod.get("productLink") or "") for prod in all_products],
+            name=[prod.get("name") for prod in all_products],
+            price=[prod.get("price") for prod in all_products],
+            product_url=[prod.get('productLink') for prod in all_products],
+            img_url=[prod.get('image') for prod in all_products],
+            # Extract ratings if available.
+            ratings=[prod['rating'].get('averageRating') if prod.get('rating') else None for prod in all_products],
+            delivery_info=delivery_info,
+            delivery_date=delivery_dates(sla_text),
+            size=[prod.get('size', size) for prod in all_products],
+        )
 
-    def discount_check(self):
+    def search_key(self, params: dict):
         """
-       Calculates the discounted price as 90% of the original price.
-       By default for all coupoun having 10%
+        Cache key for the search; equal keys fetch exactly the same results.
         """
-        for product in self.all_products:
-            if product.get('price') is not None:
-                product['discount_price'] = round(product['price'] * 0.9, 2)
-            else:
-                product['discount_price'] = None
-        return True
+        # max_price is part of the key because it decides how many pages are fetched.
+        return f"walmart:{canonical_params({'query': params['query'], 'max_price': params.get('max_price')})}"
 
-    def shipping_time_estimate(self):
+    async def asearch(self, params: dict, deadline=None):
         
         """
-        Estimate shipping time by adding a random number (1-5) of days to the current date.
-        Then sort the products by the estimated delivery date.
-        """
-        
-        params = self.params
-        target_day = params['deadline'] 
-        deadline_time  = convert_day_to_date(target_day)
+        Search for products on Walmart using the provided parameters.
+        """
+
+        key = self.search_key(params)
+        if self.flight:
+            # Concurrent identical searches share one upstream call.
+            products = await self.flight.ado(key, lambda: self._search(key, params, deadline))
+        else:
+            products = await self._search(key, params, deadline)
+
+        # Batches are immutable, so a shared or cached result is safe to hand out.
+        return products
+
+    async def _search(self, key: str, params: dict, deadline=None):
+        """
+        Fetch and format Walmart results, going through the result cache and the catalog.
+        """
+        cached = self.cache.get(key) if self.cache else None
+        if cached is None and self.cache and self.client.limiter.low():
+            # Quota is nearly used up: an expired result is better than spending it.
+            cached = self.cache.get(key, stale=True)
+        if cached is not None:
+            return ProductBatch.from_dicts(cached)
+
+        if self.catalog:
+            local = await self.catalog.alookup(key, "walmart", params['query'], params.get('max_price'), self.min_results,
+                                               fulltext=not search_filters(params))
+            if local is not None:
+                batch, age = local
+                if age > self.catalog.fresh_ttl:
+                    self.catalog.refresh(key, lambda: self._fetch(key, params))
+                return batch.sort_by("price")
+        try:
+            return await self._fetch(key, params, deadline)
+        except Exception as error:
+            # Platform unreachable: answer from the catalog, however old.
+            local = await self.catalog.aoffline(key, "walmart", params['query'], params.get('max_price'),
+                                                fulltext=not search_filters(params)) if self.catalog else None
+            if local is None:
+                raise
+            logger.warning("Walmart unavailable (%r), answering from the catalog", error)
+            return local[0].sort_by("price")
+
+    async def _fetch(self, key: str, params: dict, deadline=None):
+        # Fetch pages concurrently, stopping once enough products pass the price filter.
+        pages = await fetch_pages(lambda page: self.fetch_batch(params['query'], page, params, deadline),
+                                  self.max_pages, enough_products(self.min_results, params.get('max_price')), deadline)
+        batch = ProductBatch.concat(pages)
+
+        # Filter out products with missing essential fields, then sort by price.
+        batch = batch.filter(batch.valid_mask()).sort_by("price")
+        # Results cut short by the deadline are incomplete: not cached or recorded as the search's result.
+        complete = not (deadline and deadline.expired())
+        if self.cache and complete:
+            self.cache.set(key, batch.to_dicts())
+        if self.catalog:
+            self.catalog.ingest(batch, key if complete else None, params['query'])
+
+        return batch
+
+    def search(self, params: dict, deadline=None):
+        """
+        Blocking wrapper around asearch for the thread-based tools.
+        Raises TimeoutError if nothing returns before the deadline.
+        """
+        return run_sync(self.asearch(params, deadline), deadline.timeout() if deadline else None)
+
+    def discount_check(self, batch: ProductBatch):
         
-        for idx,product in enumerate(self.all_products):
-            rand_days = random.randint(1, 12)
-            
-            check_est_delivery = (deadline_time - datetime.now(pytz.timezone('Asia/Kolkata')) + timedelta(days=rand_days)).days
-
-            if check_est_delivery >= 0:
-                est_delivery = datetime.now(pytz.timezone('Asia/Kolkata')) + timedelta(days=rand_days)
-                product['delivery_info'] = est_delivery.strftime('%Y-%m-%d %H:%M')
-            else:
-                del self.all_products[idx]
-                
-        # Sort products based on the parsed delivery date.
-        return self.all_products
+        """
+        Calculates the discounted price as 90% of the original price.
+        By default for all coupoun having 10%
+        """
 
-    def return_policy(self):
-        
+        return batch.with_columns(discount_price=np.round(batch['price'] * 0.9, 2))
+    
+    def return_policy(self, batch: ProductBatch):
         """
         Randomly assign a return policy to each product.
-        If no return policy is applicable (as determined randomly), the product is removed.
+        Products without one (as determined randomly) get None and are dropped by the pipeline.
         """
-        
-        filtered_products = []
-        for product in self.all_products:
-            rand_n = random.randint(1, 3)
-            if rand_n == 1:
-                product['return_policy'] = "2 days Return Policy"
-                filtered_products.append(product)
-            elif rand_n == 2:
-                product['return_policy'] = "3 days Return Policy"
-                filtered_products.append(product)
-            else:
-                continue  # Exclude the product if no return policy applies.
-        self.all_products = filtered_products
-        return self.all_products
+
+        rand_n = np.random.randint(1, 4, size=len(batch))
+        policy = np.select([rand_n == 1, rand_n == 2], ["2 days Return Policy", "3 days Return Policy"], "")
+        return batch.with_columns(return_policy=np.where(rand_n == 3, None, policy.astype(object)))
 
 
 # TOOLS HELPER CLASS
 class Tools:
     def __init__(self):
         """
-        Initialize with the search/filter parameters.
-        Set up the common output format and select the target platforms.
-        """
-        self.product_output_format = product_output_format
+        Shared, stateless tool runner: adapters, caches and the worker pool.
+        Per-query params and results live in a RequestContext.
+        """
+        # Formatted search results shared by every platform, on disk if SEARCH_CACHE_PATH is set.
+        self.cache = ResultCache(ttl=float(os.getenv("SEARCH_CACHE_TTL", 300)),
+                                 max_size=int(os.getenv("SEARCH_CACHE_SIZE", 512)),
+                                 path=os.getenv("SEARCH_CACHE_PATH"), name="search",
+                                 stale_ttl=float(os.getenv("SEARCH_CACHE_STALE_TTL", 86400)))
+        # Every product fetched, for local answers, offline operation and price history.
+        # An empty CATALOG_PATH turns it off.
+        catalog_path = os.getenv("CATALOG_PATH", "catalog.db")
+        self.catalog = Catalog(catalog_path, fresh_ttl=float(os.getenv("CATALOG_FRESH_S", 3600)),
+                               stale_ttl=float(os.getenv("CATALOG_STALE_S", 86400))) if catalog_path else None
+        # Coalesces identical in-flight searches across concurrent sessions.
+        self.flight = SingleFlight("search")
         # Map platform names to their instantiated objects.
+        max_pages = int(os.getenv("SEARCH_MAX_PAGES", 3))
+        min_results = int(os.getenv("SEARCH_MIN_RESULTS", 20))
         self.platforms_map = {
-            "amazon": Amazon(),
-            "walmart": Walmart()
+            "amazon": Amazon(self.cache, self.flight, max_pages, min_results, self.catalog),
+            "walmart": Walmart(self.cache, self.flight, max_pages, min_results, self.catalog)
         }
+        # Cross-platform product matches for price comparison, kept across restarts.
+        self.matches = MatchIndex(os.getenv("MATCH_INDEX_PATH", "match_index.db"),
+                                  threshold=float(os.getenv("MATCH_THRESHOLD", 0.5)))
+        # Long-lived worker pool that runs the selected tools per platform.
+        self.pipeline = Pipeline(self.search_platform)
           
-    def search_platform(self, platform_obj, platform: str, params: dict):
+    def search_platform(self, platform_obj, platform: str, params: dict, deadline=None, prefetched=None):
         
         """
         Call the search method for the given platform and return its products.
-        Also, set the platform object's parameters and output format.
-        """
-        
-        print(f"Searching for '{params.get('query')}' on {platform}")
-        platform_obj.params = params
-        platform_obj.product_op_format = self.product_output_format
-        return platform_obj.search()
-
-    def search_products(self):
-
-        """
-        Search for products concurrently across all selected platforms.
+        prefetched is a speculative search for the same key already in flight; it is
+        awaited instead of searching again.
         """
-
         
-        if not self.params.get("query"):
-            print("No query provided for product search.")
-            return
-
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_platform = {
-                executor.submit(self.search_platform, platform_obj, platform, self.params): platform
-                for platform, platform_obj in self.platform_objects.items()
-            }
-            for future in concurrent.futures.as_completed(future_to_platform):
-                platform = future_to_platform[future]
-                try:
-                    products = future.result()
-                    self.searched_products[platform]['products'] = products
-                    print(f"{str(len(products))} Products fetched from the {platform}")
-                except Exception as e:
-                    print(f"Error while searching on {platform}: {e}")
-
-    def check_discount_coupon_site_wise(self, platform_obj, platform: str, params: dict):
-        """
-        Apply discount processing on the given platform.
-        """
-        print(f"Applying discount for '{params.get('query')}' on {platform}")
-
-        platform_obj.params = params
-        return platform_obj.discount_check()
-
-    def check_discount(self):
-
-        """
-        If discount deals are enabled, apply discount processing concurrently.
-        """
-        self.params['coupon_code'] = "TEST LOGIC"
-        if self.params.get('coupon_code'):
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future_to_platform = {
-                    executor.submit(self.check_discount_coupon_site_wise, platform_obj, platform, self.params): platform
-                    for platform, platform_obj in self.platform_objects.items()
-                }
-                for future in concurrent.futures.as_completed(future_to_platform):
-                    platform = future_to_platform[future]
-                    try:
-                        self.searched_products[platform]['discount_validity'] = future.result()
-                    except Exception as e:
-                        print(f"Error while applying discount on {platform}: {e}")
-
-    def price_condition(self, platform: str):
-        """
-        Filter the products from the given platform to those at or below max_price.
-        """
-        max_price = self.params.get('max_price', float('inf'))
-        return [product for product in self.searched_products[platform]['products']
-                if product.get('price', 0) <= max_price]
-
-    def price_filter(self):
-        """
-        Filter products by price concurrently across platforms.
-        """
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            print("1")
-            future_to_platform = {
-                executor.submit(self.price_condition, platform): platform
-                for platform in self.searched_products
-            }
-            for future in concurrent.futures.as_completed(future_to_platform):
-                platform = future_to_platform[future]
+        logger.info("Searching for '%s' on %s", params.get('query'), platform)
+        with metrics.span("fetch", platform=platform, speculative=prefetched is not None) as span:
+            if prefetched is not None:
                 try:
-                    self.searched_products[platform]['products'] = future.result()
-
-                except Exception as e:
-                    print(f"Error filtering products by price on {platform}: {e}")
+                    batch = prefetched.result(deadline.timeout() if deadline else None)
+                except concurrent.futures.TimeoutError:
+                    prefetched.cancel()
+                    raise
+            else:
+                batch = platform_obj.search(params, deadline)
+            span.set(products_out=len(batch))
+        # Every product seen is queued for indexing, so later comparisons can pair it with the other platform.
+        self.matches.add(batch)
+        return batch
 
-    def shipping_time_site_wise(self, platform_obj, platform: str, params: dict):
+    def select_platforms(self, params):
         """
-        Calculate shipping time estimation for the given platform.
+        Determine which platforms to search. If 'all' is specified, search both.
         """
-        print(f"Calculating shipping time for '{params.get('query')}' on {platform}")
-        platform_obj.params = self.params
-        return platform_obj.shipping_time_estimate()
+        selected_platforms = ["amazon", "walmart"] if params['platform'] == 'all' else [params['platform']]
+        return {platform: self.platforms_map[platform] for platform in selected_platforms}
 
-    def check_shipping_time(self):
+    def request(self, params, tools, deadline=None, prefetched=None):
         """
-        Calculate shipping time concurrently for all platforms.
+        Build the context for one query. Nothing about the query is stored on Tools,
+        so concurrent queries never see each other's params or results.
         """
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_platform = {
-                executor.submit(self.shipping_time_site_wise, platform_obj, platform, self.params): platform
-                for platform, platform_obj in self.platform_objects.items()
-            }
-            for future in concurrent.futures.as_completed(future_to_platform):
-                platform = future_to_platform[future]
-                try:
-                    self.searched_products[platform]['products'] = future.result()
-                except Exception as e:
-                    print(f"Error while calculating shipping time on {platform}: {e}")
+        return RequestContext(params, tools, self.select_platforms(params), deadline, prefetched)
 
-    def return_policy_site_wise(self, platform_obj, platform: str, params: dict):
+    def main(self, params, tools, deadline=None, prefetched=None):
         
         """
-        Apply return policy processing for the given platform.
+        Main execution flow, fused into one pass per platform:
+         1. Search products across platforms.
+         2. Filter products by max price.
+         3. Drop products whose parsed delivery date misses the deadline.
+         4. Apply return policy processing and remove products that don't provide one.
+         5. Apply discount if enabled.
+         6. Sort and record the price range if price comparison is requested.
+         7. Return the consolidated results.
+        Platforms still running at the deadline are returned empty and flagged partial.
         """
-
-        print(f"Checking return policy for '{params.get('query')}' on {platform}")
         
-        platform_obj.params =self.params
-
-        return platform_obj.return_policy()
+        logger.info("Tools to call: %s | params: %s", [k for k,v in tools.items() if v], params)
+        context = self.request(params, tools, deadline, prefetched)
+  
+        # Search, filters and comparison run as one fused pass per platform.
+        return self.pipeline.run(context)
 
-    def check_return_policy(self):
-       
+    def stream(self, params, tools, deadline=None, prefetched=None):
         """
-        Apply return policy processing concurrently for all platforms.
+        Same flow as main, yielding (platform, result) as each platform finishes.
         """
-       
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_platform = {
-                executor.submit(self.return_policy_site_wise, platform_obj, platform, self.params): platform
-                for platform, platform_obj in self.platform_objects.items()
-            }
-            for future in concurrent.futures.as_completed(future_to_platform):
-                platform = future_to_platform[future]
-                try:
-                    self.searched_products[platform]['products'] = future.result()
-                    self.searched_products[platform]['return_policy'] = True
-                except Exception as e:
-                    print(f"Error while checking return policy on {platform}: {e}")
-
-    def price_comparison(self):
+        return self.pipeline.stream(self.request(params, tools, deadline, prefetched))
 
+    def compare(self, results: dict, deadline=None):
         """
-        Search for products concurrently across all selected platforms.
+        Price comparison between the same products on both platforms.
         """
-        
-        if not self.params.get("query"):
-            print("No query provided for product search.")
-            return
-        
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            future_to_platform = {
-                executor.submit(self.search_platform, platform_obj, platform, self.params): platform
-                for platform, platform_obj in self.platform_objects.items()
-            }
-            for future in concurrent.futures.as_completed(future_to_platform):
-                platform = future_to_platform[future]
-                
-                try:
-                    products = future.result()
-                    self.searched_products[platform]['products'] = sorted(products, key = lambda x : x['price'])
-                    
-                    self.searched_products[platform]['min_price'] = self.searched_products[platform]['products'][0]['price'] # Min Price
-                    self.searched_products[platform]['max_price'] = self.searched_products[platform]['products'][-1]['price'] # Max Price
+        return self.matches.compare(results, deadline)
 
-                except Exception as e:
-                    print(f"Error while searching on {platform}: {e}")
-
-    def main(self, params, tools):
-        
+    def stream_actions(self, actions, deadline=None, prefetched=None):
         """
-        Main execution flow:
-         1. Search products across platforms.
-         2. Apply discount if enabled.
-         3. Estimate shipping times .
-         4. Filter products by max price.
-         5. Apply return policy processing if a deadline is provided and remove products doesn't provide return policy.
-         6. Return the consolidated results.
+        Run independent (tools, params) actions in parallel, e.g. several tool calls from
+        one planning step, yielding (action index, platform, result) as each platform finishes.
+        prefetched applies to the first action, which the speculative search was started for.
         """
-        
-        self.params = params
-        print("="*30)
-        print('Tools Need to call :' , [k for k,v in tools.items() if v])
-        print("Parameters : ", self.params)
-        print("="*30)
-        # Determine which platforms to search. If 'all' is specified, search both.
-        selected_platforms = ["amazon", "walmart"] if self.params['platform'] == 'all' else [self.params['platform']]
-
-        self.platform_objects = {platform: self.platforms_map[platform] for platform in selected_platforms}
-  
-        # Initialize a dictionary to hold search results from each platform.
-        self.searched_products = {platform: {} for platform in self.platform_objects}
-        
-        if tools.get("search_products", None):
-            print("Tool : Searching Product is called ")
-            self.search_products() #  DONE
-        
-        if tools.get('check_discount', None):
-            print("Tool : Check Discount is callled")
-            self.check_discount() # DONE
-        
-        if tools.get('price_filter', None) :
-            print("Tool : Price Filter is called")
-            self.price_filter() # DONE
-
-        if tools.get('check_shipping_time', None):
-            print("Tool : Check Shipping Time is called")
-            self.check_shipping_time() # DONE
-        
-        if tools.get('check_return_policy', None):
-            print("Tool : Check Shipping Time is called")
-            self.check_return_policy() # DONE
-        
-        if tools.get("price_comparison", None):
-            print("Tool : Price Comparison is called ")
-            self.price_comparison() # DONE
-            
-        return self.searched_products
+        contexts = [self.request(params, tools, deadline, prefetched if i == 0 else None)
+                    for i, (tools, params) in enumerate(actions)]
+        index = {id(context): i for i, context in enumerate(contexts)}
+        for context, platform, result in self.pipeline.stream_many(contexts):
+            yield index[id(context)], platform, result
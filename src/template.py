@@ -16,4 +16,47 @@ product_output_format = {
             "ratings": None,
             "delivery_info": "",
             "size": 4,
-        }
\ No newline at end of file
+        }
+
+# Function schemas for the structured (tool-calling) planner; names match all_tools.
+platform_schema = {"type": "string", "enum": ["all", "amazon", "walmart"]}
+tool_specs = [
+    {"type": "function", "function": {
+        "name": "search_products",
+        "description": "Search for products on Amazon, Walmart or both. Call once per distinct product or platform.",
+        "parameters": {"type": "object", "properties": {
+            "query": {"type": "string", "description": "Product words only, without price, size, date or coupon."},
+            "platform": platform_schema,
+            "brand": {"type": "string"},
+            "size": {"type": "string"}},
+            "required": ["query", "platform"]}}},
+    {"type": "function", "function": {
+        "name": "check_discount",
+        "description": "Verify whether a coupon code is valid on a platform.",
+        "parameters": {"type": "object", "properties": {
+            "coupon_code": {"type": "string"},
+            "platform": platform_schema},
+            "required": ["coupon_code"]}}},
+    {"type": "function", "function": {
+        "name": "price_filter",
+        "description": "Keep only products priced at or below max_price.",
+        "parameters": {"type": "object", "properties": {
+            "max_price": {"type": "integer"}},
+            "required": ["max_price"]}}},
+    {"type": "function", "function": {
+        "name": "check_shipping_time",
+        "description": "Keep only products that arrive before the given day of the week.",
+        "parameters": {"type": "object", "properties": {
+            "deadline": {"type": "string", "description": "Day of the week, e.g. Friday."}},
+            "required": ["deadline"]}}},
+    {"type": "function", "function": {
+        "name": "price_comparison",
+        "description": "Compare product prices across platforms, optionally against a known price.",
+        "parameters": {"type": "object", "properties": {
+            "platform": platform_schema,
+            "max_price": {"type": "integer"}}}}},
+    {"type": "function", "function": {
+        "name": "check_return_policy",
+        "description": "Keep only products that offer a return policy.",
+        "parameters": {"type": "object", "properties": {}}}},
+]
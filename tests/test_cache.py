@@ -0,0 +1,26 @@
+import time
+
+import pytest
+
+from src.Cache import ResultCache
+
+
+@pytest.fixture(params=["memory", "disk"])
+def cache(request, tmp_path):
+    path = str(tmp_path / "cache.db") if request.param == "disk" else None
+    return ResultCache(ttl=0.05, path=path, stale_ttl=0.1)
+
+
+def test_expired_entry_is_only_read_stale(cache):
+    cache.set("key", {"products": [1]})
+    assert cache.get("key") == {"products": [1]}
+    time.sleep(0.06)
+    assert cache.get("key") is None
+    assert cache.get("key", stale=True) == {"products": [1]}
+    assert (cache.hits, cache.stale_hits, cache.misses) == (1, 1, 1)
+
+
+def test_stale_window_ends(cache):
+    cache.set("key", [1])
+    time.sleep(0.16)
+    assert cache.get("key", stale=True) is None
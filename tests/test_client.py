@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from src.Client import fetch_pages
+from src.Deadline import Deadline
+
+
+def pages(sizes: dict, fail: set = (), delay: float = 0.0):
+    """
+    fetch_page stand-in: page n holds sizes.get(n, 0) items, pages in fail raise.
+    Returns it with the list of pages requested.
+    """
+    requested = []
+
+    async def fetch_page(page):
+        requested.append(page)
+        await asyncio.sleep(delay)
+        if page in fail:
+            raise ConnectionError(f"page {page}")
+        return list(range(sizes.get(page, 0)))
+
+    return fetch_page, requested
+
+
+def test_first_page_enough_stops_early():
+    fetch_page, requested = pages({1: 20, 2: 20, 3: 20})
+    result = asyncio.run(fetch_pages(fetch_page, 3, enough=lambda found: sum(map(len, found)) >= 20))
+    assert requested == [1]
+    assert [len(page) for page in result] == [20]
+
+
+def test_fetches_until_enough():
+    fetch_page, requested = pages({page: 10 for page in range(1, 6)})
+    result = asyncio.run(fetch_pages(fetch_page, 5, enough=lambda found: sum(map(len, found)) >= 30))
+    assert sum(map(len, result)) >= 30
+    # Never more than one window of pages past the point where enough was reached.
+    assert requested[:3] == [1, 2, 3] and 5 not in requested
+
+
+def test_empty_page_ends_pagination():
+    fetch_page, requested = pages({1: 20, 2: 20})
+    result = asyncio.run(fetch_pages(fetch_page, 5))
+    assert [len(page) for page in result] == [20, 20]
+    assert 5 not in requested
+
+
+def test_later_page_failure_keeps_earlier_pages():
+    fetch_page, requested = pages({1: 20, 2: 20, 3: 20}, fail={2})
+    result = asyncio.run(fetch_pages(fetch_page, 3))
+    assert [len(page) for page in result] == [20]
+
+
+def test_first_page_failure_is_raised():
+    fetch_page, _ = pages({2: 20}, fail={1})
+    with pytest.raises(ConnectionError):
+        asyncio.run(fetch_pages(fetch_page, 3))
+
+
+def test_deadline_keeps_what_arrived():
+    fetch_page, requested = pages({1: 20, 2: 20, 3: 20}, delay=0.05)
+    result = asyncio.run(fetch_pages(fetch_page, 3, deadline=Deadline(0.08)))
+    assert [len(page) for page in result] == [20]
@@ -0,0 +1,57 @@
+from datetime import date
+
+import numpy as np
+
+from src.Delivery import deadline_date, delivery_dates, parse_delivery
+
+# A Sunday.
+today = date(2026, 10, 18)
+
+
+def test_amazon_weekday_range_counts_as_last_day():
+    assert parse_delivery("FREE delivery Sat, Oct 24 - Mon, Oct 26", today) == date(2026, 10, 26)
+
+
+def test_ranges_and_single_dates():
+    assert parse_delivery("Delivery Oct 30 - Nov 2", today) == date(2026, 11, 2)
+    assert parse_delivery("Oct 25 - 28", today) == date(2026, 10, 28)
+    assert parse_delivery("FREE delivery Fri, Oct 23 on $35 shipped by Amazon", today) == date(2026, 10, 23)
+
+
+def test_fastest_option_is_earliest():
+    text = "FREE delivery Sat, Oct 24\nOr fastest delivery Tomorrow, Oct 19"
+    assert parse_delivery(text, today) == date(2026, 10, 19)
+
+
+def test_fraction_is_not_a_date():
+    assert parse_delivery("in stock 1/2 price", today) is None
+
+
+def test_numeric_dates_need_a_delivery_word_or_year():
+    assert parse_delivery("Delivery by 10/25", today) == date(2026, 10, 25)
+    assert parse_delivery("Arrives Fri, 10/23", today) == date(2026, 10, 23)
+    assert parse_delivery("10/25/2026", today) == date(2026, 10, 25)
+    assert parse_delivery("2026-11-01", today) == date(2026, 11, 1)
+
+
+def test_walmart_sla_text():
+    assert parse_delivery("arrives in 3 days", today) == date(2026, 10, 21)
+    assert parse_delivery("Arrives in 2-4 business days", today) == date(2026, 10, 22)
+    assert parse_delivery("arrives tomorrow", today) == date(2026, 10, 19)
+    assert parse_delivery("Arrives Friday", today) == date(2026, 10, 23)
+    assert parse_delivery("Satisfaction guaranteed", today) is None
+
+
+def test_delivery_dates_column():
+    column = delivery_dates(["arrives in 3 days", None, "no info"], today)
+    assert column.dtype == np.dtype("datetime64[m]")
+    assert column[0] == np.datetime64("2026-10-21T00:00")
+    assert np.isnat(column[1:]).all()
+
+
+def test_deadline_date():
+    assert deadline_date("Friday", today) == np.datetime64("2026-10-23T00:00")
+    # The same weekday as today means next week.
+    assert deadline_date("sunday", today) == np.datetime64("2026-10-25T00:00")
+    assert deadline_date("Oct 25", today) == np.datetime64("2026-10-25T00:00")
+    assert deadline_date("sunglasses", today) is None
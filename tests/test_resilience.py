@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+from src.Resilience import CircuitBreaker, CircuitOpenError, Resilience, RetryBudget
+
+
+class Transient(Exception):
+    pass
+
+
+def policy(name, **kwargs):
+    options = {"retries": 0, "base_delay": 0.0, "max_delay": 0.0, "failure_threshold": 2, "reset_timeout": 60.0}
+    return Resilience(f"test-{name}", lambda error: isinstance(error, Transient), **{**options, **kwargs})
+
+
+def failing():
+    raise Transient()
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("test-breaker", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.acquire() == CircuitBreaker.closed
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.open
+    assert breaker.acquire() is None
+
+    time.sleep(0.06)
+    # One probe at a time once the reset timeout has passed.
+    assert breaker.acquire() == CircuitBreaker.half_open
+    assert breaker.acquire() is None
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.closed
+    assert breaker.acquire() == CircuitBreaker.closed
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test-reopen", failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.acquire() == CircuitBreaker.half_open
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.open
+
+
+def test_policy_rejects_while_open():
+    resilience = policy("open")
+    for _ in range(2):
+        with pytest.raises(Transient):
+            resilience.call(failing)
+    with pytest.raises(CircuitOpenError):
+        resilience.call(lambda: "unreachable")
+    assert resilience.counts["rejected"] == 1
+
+
+def test_cancelled_probe_is_released():
+    resilience = policy("cancel", failure_threshold=1, reset_timeout=0.0)
+    resilience.breaker.record_failure()
+
+    async def cancel_probe():
+        task = asyncio.ensure_future(resilience.acall(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        assert resilience.breaker.probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_probe())
+    assert resilience.breaker.acquire() == CircuitBreaker.half_open
+
+
+def test_retry_budget_exhaustion():
+    budget = RetryBudget(ratio=0.5, minimum=1.0)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+    resilience = policy("budget", retries=5, failure_threshold=100)
+    resilience.budget = RetryBudget(ratio=0.0, minimum=1.0)
+    calls = []
+
+    def attempt():
+        calls.append(1)
+        raise Transient()
+
+    with pytest.raises(Transient):
+        resilience.call(attempt)
+    # The first call plus the one retry the budget allows, not five.
+    assert len(calls) == 2
+    assert resilience.counts["retries"] == 1
+
+
+def test_errors_that_are_not_retryable_do_not_count():
+    resilience = policy("fatal", retries=3)
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            resilience.call(lambda: int("x"))
+    assert resilience.breaker.state == CircuitBreaker.closed
+    assert resilience.counts["failures"] == 0
+
+
+def hedged(name, delays):
+    """
+    Hedging policy whose p95 is 10 ms and a call whose nth attempt takes delays[n] seconds.
+    """
+    resilience = policy(name, hedge=True, hedge_min_samples=20)
+    resilience.latencies.extend([0.01] * 20)
+    attempts = []
+
+    async def call():
+        number = len(attempts)
+        attempts.append(number)
+        await asyncio.sleep(delays[number])
+        return number
+
+    return resilience, call, attempts
+
+
+def test_hedge_wins_when_first_attempt_is_slow():
+    resilience, call, attempts = hedged("hedge-win", [1.0, 0.0])
+    assert asyncio.run(resilience.acall(call)) == 1
+    assert attempts == [0, 1]
+    assert resilience.counts["hedges"] == 1
+    assert resilience.counts["hedge_wins"] == 1
+
+
+def test_first_attempt_wins_over_hedge():
+    resilience, call, attempts = hedged("first-win", [0.03, 1.0])
+    assert asyncio.run(resilience.acall(call)) == 0
+    assert attempts == [0, 1]
+    assert resilience.counts["hedges"] == 1
+    assert resilience.counts["hedge_wins"] == 0
+
+
+def test_fast_call_is_not_hedged():
+    resilience, call, attempts = hedged("no-hedge", [0.0])
+    assert asyncio.run(resilience.acall(call)) == 0
+    assert attempts == [0]
+    assert resilience.counts["hedges"] == 0
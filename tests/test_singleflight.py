@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from src.SingleFlight import SingleFlight
+
+
+def counted(delay: float = 0.05):
+    """
+    Coroutine function that records each real call and its cancellation.
+    """
+    calls = {"started": 0, "cancelled": 0}
+
+    async def call():
+        calls["started"] += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            calls["cancelled"] += 1
+            raise
+        return "result"
+
+    return call, calls
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test-share")
+    call, calls = counted()
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("key", call) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["result"] * 3
+    assert calls["started"] == 1
+    assert flight.stats()["shared"] == 2
+
+
+def test_one_cancelled_waiter_does_not_cancel_the_others():
+    flight = SingleFlight("test-cancel-one")
+    call, calls = counted()
+
+    async def run():
+        first = asyncio.ensure_future(flight.ado("key", call))
+        second = asyncio.ensure_future(flight.ado("key", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "result"
+    assert calls["cancelled"] == 0
+
+
+def test_call_is_cancelled_with_its_last_waiter():
+    flight = SingleFlight("test-cancel-all")
+    call, calls = counted()
+
+    async def run():
+        waiter = asyncio.ensure_future(flight.ado("key", call))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        # A new caller starts a fresh call rather than joining the cancelled one.
+        return await flight.ado("key", call)
+
+    assert asyncio.run(run()) == "result"
+    assert calls == {"started": 2, "cancelled": 1}